@@ -7,7 +7,6 @@ from backend.config import SECRET_KEY, ALGORITHM, SessionLocal
 from backend.models import User
 from dotenv import load_dotenv
 import os
-from passlib.context import CryptContext
 from . import models, schemas, security
 from .models import User
 from . import schemas
@@ -57,7 +56,7 @@ def decode_access_token(token: str) -> dict:
 def authenticate_user(db: Session, username: str, password: str):
     """Проверяет пользователя по базе данных."""
     user = db.query(User).filter(User.username == username).first()
-    if not user or password != user.password:
+    if not user or not crud.check_user_password(db, user, password):
         return None
     return user
 
@@ -69,7 +68,8 @@ def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
     if existing_user:
         raise HTTPException(status_code=400, detail="Email уже используется")
 
-    new_user = models.User(username=user_data.username, email=user_data.email, password=user_data.password)
+    new_user = models.User(username=user_data.username, email=user_data.email,
+                           password=crud.hash_password(user_data.password))
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
@@ -83,10 +83,8 @@ def login(user_data: schemas.UserLogin, db: Session = Depends(get_db)):
     
     # ЛОГ ДЛЯ ОТЛАДКИ
     print("Пользователь в БД:", user.email if user else "Не найден")
-    print("Введённый пароль:", user_data.password)
-    print("Пароль в БД:", user.password if user else "Нет пароля")
 
-    if not user or user_data.password != user.password:
+    if not user or not crud.check_user_password(db, user, user_data.password):
         raise HTTPException(status_code=400, detail="Неверный email или пароль")
 
     access_token = create_access_token(data={"sub": user.email})
@@ -95,37 +93,9 @@ def login(user_data: schemas.UserLogin, db: Session = Depends(get_db)):
 
 
 @router.get("/me")
-def get_me(user: models.User = Depends(security.get_current_user)):
+def get_me(user: security.Principal = Depends(security.get_current_user)):
     """Получение данных о текущем пользователе"""
     return {"username": user.username, "email": user.email}
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Функция для получения текущего пользователя по токену"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    return user
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Не удалось подтвердить учетные данные",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    payload = auth.decode_access_token(token)
-    if payload is None:
-        print("Ошибка: payload пустой")
-        raise credentials_exception
-    user = crud.get_user_by_email(db, payload.get("sub"))
-    if user is None:
-        print("Ошибка: пользователь не найден")
-        raise credentials_exception
-    return user
-
+# Текущий пользователь по токену — общая зависимость с кэшем (см. security.py)
+get_current_user = security.get_current_user
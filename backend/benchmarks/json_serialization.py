@@ -0,0 +1,91 @@
+"""
+Микробенчмарк сериализации больших списков: обычный путь против быстрого.
+
+Обычный путь: ORM-объекты → валидация схемой ответа (EventOut/UserOut/
+TicketOut) → jsonable_encoder → json.dumps. Быстрый (backend/fastjson.py):
+кортежи колонок → словари → orjson (или json, если orjson не установлен).
+БД не нужна: строки генерируются, создание ORM-объектов и кортежей замеряется
+отдельно как приближение к стоимости загрузки результата запроса.
+
+    python -m backend.benchmarks.json_serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+from backend import crud, fastjson, models, schemas
+from backend.routers.events import EVENT_FIELDS
+
+
+def event_values(i: int) -> dict:
+    return {
+        "id": i, "name": f"Событие {i}", "description": "Описание события " * 4,
+        "location": "Алматы, Дворец Республики", "date": datetime(2025, 3, 17) + timedelta(minutes=i),
+        "price": 1000 + i % 50, "category": ("concerts", "sport", "movies")[i % 3],
+        "available_tickets": i % 200, "total_tickets": 200,
+    }
+
+
+def user_values(i: int) -> dict:
+    return {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "is_admin": i % 100 == 0}
+
+
+def ticket_values(i: int) -> dict:
+    return {"id": i, "user_id": 1, "event_id": i % 500, "purchase_date": datetime(2025, 3, 1) + timedelta(seconds=i)}
+
+
+CASES = [
+    ("events", models.Event, schemas.EventOut, EVENT_FIELDS, event_values),
+    ("users", models.User, schemas.UserOut, crud.USER_FIELDS, user_values),
+    ("tickets", models.Ticket, schemas.TicketOut, crud.TICKET_FIELDS, ticket_values),
+]
+
+
+def timed(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+def run(name, model, schema, fields, values, rows: int, repeat: int):
+    data = [values(i) for i in range(rows)]
+
+    build_orm, objects = timed(lambda: [model(**row) for row in data], repeat)
+    build_tuples, tuples = timed(lambda: [tuple(row[f] for f in fields) for row in data], repeat)
+
+    def standard():
+        items = [schema.model_validate(obj) for obj in objects]
+        return json.dumps(jsonable_encoder(items), ensure_ascii=False).encode()
+
+    def fast():
+        return fastjson.dumps(fastjson.rows_to_dicts(tuples, fields))
+
+    standard_time, standard_body = timed(standard, repeat)
+    fast_time, fast_body = timed(fast, repeat)
+    assert json.loads(standard_body) == json.loads(fast_body), f"{name}: ответы различаются"
+
+    print(f"{name:8} build ORM {build_orm * 1000:8.1f} мс  tuples {build_tuples * 1000:7.1f} мс  |  "
+          f"serialize standard {standard_time * 1000:8.1f} мс  fast {fast_time * 1000:7.1f} мс  "
+          f"(x{standard_time / fast_time:.1f}, {len(fast_body) // 1024} КБ)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Кодировщик быстрого пути: {'orjson' if fastjson.orjson is not None else 'json (orjson не установлен)'}")
+    for case in CASES:
+        run(*case, rows=args.rows, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
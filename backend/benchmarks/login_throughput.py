@@ -0,0 +1,86 @@
+"""
+Бенчмарк пропускной способности проверки паролей при входе.
+
+Имитирует «шторм логинов»: clients потоков одновременно проверяют пароль.
+Режим inline вызывает bcrypt прямо в потоке запроса (как раньше), режим pool
+идёт через ограниченный пул backend/hashing.py. Для каждого режима печатает
+логины в секунду, отказы из-за переполнения очереди и задержку отклика
+лёгкого запроса, выполняемого параллельно со штормом.
+
+    BCRYPT_ROUNDS=12 python -m backend.benchmarks.login_throughput --logins 400 --clients 40
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from passlib.context import CryptContext
+
+from backend import hashing
+
+
+def light_request_latency(stop: threading.Event, samples: list):
+    # Лёгкая работа на Python (как обычный эндпоинт) рядом со штормом логинов
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(2000))
+        samples.append(time.perf_counter() - started)
+        time.sleep(0.005)
+
+
+def run(mode: str, logins: int, clients: int):
+    inline_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=hashing.BCRYPT_ROUNDS)
+    stored = inline_context.hash("correct horse battery staple")
+    verify = inline_context.verify if mode == "inline" else hashing.verify_password
+
+    remaining = [logins]
+    counter_lock = threading.Lock()
+    done, rejected = [0], [0]
+
+    def client():
+        while True:
+            with counter_lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                verify("correct horse battery staple", stored)
+                with counter_lock:
+                    done[0] += 1
+            except hashing.HashingOverloaded:
+                with counter_lock:
+                    rejected[0] += 1
+                time.sleep(0.01)
+
+    stop, latencies = threading.Event(), []
+    probe = threading.Thread(target=light_request_latency, args=(stop, latencies))
+    probe.start()
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe.join()
+
+    p99 = statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) >= 2 else float("nan")
+    print(f"mode={mode} rounds={hashing.BCRYPT_ROUNDS} clients={clients} workers={hashing.HASH_WORKERS}")
+    print(f"  logins={done[0]} rejected={rejected[0]} elapsed={elapsed:.2f}s "
+          f"throughput={done[0] / elapsed:.1f} logins/s light_request_p99={p99:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inline", "pool", "both"], default="both")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=40)
+    args = parser.parse_args()
+    for mode in (["inline", "pool"] if args.mode == "both" else [args.mode]):
+        run(mode, args.logins, args.clients)
+
+
+if __name__ == "__main__":
+    main()
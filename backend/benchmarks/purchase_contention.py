@@ -0,0 +1,143 @@
+"""
+Бенчмарк покупки билетов при высокой конкуренции за одно «горячее» событие.
+
+Создаёт событие с заданным числом билетов и тестового пользователя, затем
+несколько потоков покупают билеты, пока они не закончатся. Печатает
+покупки в секунду и проверяет, что продано ровно столько, сколько было.
+
+    python -m backend.benchmarks.purchase_contention --tickets 2000 --buyers 32
+    python -m backend.benchmarks.purchase_contention --mode legacy
+    python -m backend.benchmarks.purchase_contention --mode sharded --shards 16
+
+Режим legacy воспроизводит прежний путь (SELECT, затем UPDATE и отдельная
+вставка билета) для сравнения; он может продать лишние билеты. Режим sharded
+переводит событие в режим частей остатка (backend/inventory.py) и после
+прогона сверяет events.available_tickets.
+"""
+import argparse
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from backend import crud, inventory, models
+from backend.config import Base, SessionLocal, engine
+
+
+def setup(tickets: int):
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:8]
+        user = models.User(username=f"bench-{suffix}", email=f"bench-{suffix}@example.com", password="-")
+        event = models.Event(name=f"Benchmark {suffix}", location="bench", date=datetime.utcnow() + timedelta(days=30),
+                             price=0, category="bench", available_tickets=tickets, total_tickets=tickets)
+        db.add_all([user, event])
+        db.commit()
+        return user.id, event.id
+    finally:
+        db.close()
+
+
+def teardown(user_id: int, event_id: int):
+    db = SessionLocal()
+    try:
+        db.query(models.Ticket).filter(models.Ticket.event_id == event_id).delete()
+        db.query(models.EventChange).filter(models.EventChange.event_id == event_id).delete()
+        db.query(models.EventStockShard).filter(models.EventStockShard.event_id == event_id).delete()
+        db.query(models.Event).filter(models.Event.id == event_id).delete()
+        db.query(models.User).filter(models.User.id == user_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def buy_pooled(db, user_id: int, event_id: int) -> bool:
+    try:
+        crud.purchase_ticket(db, user_id, event_id)
+        return True
+    except HTTPException as e:
+        if e.status_code == 400:
+            return False
+        raise
+
+
+def buy_legacy(db, user_id: int, event_id: int) -> bool:
+    available = db.execute(text("SELECT available_tickets FROM events WHERE id = :id"),
+                           {"id": event_id}).scalar()
+    if available <= 0:
+        db.rollback()
+        return False
+    db.execute(text("UPDATE events SET available_tickets = available_tickets - 1 WHERE id = :id"),
+               {"id": event_id})
+    db.commit()
+    db.add(models.Ticket(user_id=user_id, event_id=event_id))
+    db.commit()
+    return True
+
+
+def run(mode: str, tickets: int, buyers: int, shards: int):
+    Base.metadata.create_all(bind=engine)
+    user_id, event_id = setup(tickets)
+    buy = buy_legacy if mode == "legacy" else buy_pooled
+    if mode == "sharded":
+        db = SessionLocal()
+        try:
+            inventory.enable_sharding(db, event_id, shards)
+        finally:
+            db.close()
+    sold = [0] * buyers
+    errors = []
+
+    def buyer(i: int):
+        db = SessionLocal()
+        try:
+            while buy(db, user_id, event_id):
+                sold[i] += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(buyers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        if mode == "sharded":
+            inventory.reconcile(db)
+        inserted = db.query(models.Ticket).filter(models.Ticket.event_id == event_id).count()
+        remaining = db.query(models.Event.available_tickets).filter(models.Event.id == event_id).scalar()
+    finally:
+        db.close()
+    teardown(user_id, event_id)
+
+    total = sum(sold)
+    print(f"mode={mode} buyers={buyers} tickets={tickets}" + (f" shards={shards}" if mode == "sharded" else ""))
+    print(f"  sold={total} tickets_rows={inserted} remaining={remaining} errors={len(errors)}")
+    print(f"  elapsed={elapsed:.2f}s throughput={total / elapsed:.0f} purchases/s")
+    if inserted != tickets - remaining:
+        print("  ⚠️ tickets and stock disagree")
+    if remaining < 0 or inserted > tickets:
+        print("  ⚠️ oversold")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pooled", "legacy", "sharded"], default="pooled")
+    parser.add_argument("--shards", type=int, default=16)
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--buyers", type=int, default=32)
+    args = parser.parse_args()
+    run(args.mode, args.tickets, args.buyers, args.shards)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Бенчмарк холодного старта сервисов.
+
+Запускает сервер командой --cmd (по умолчанию бэкенд) и опрашивает /live и
+/ready. Печатает время до первого ответа /live (процесс принимает запросы) и
+до первого 200 от /ready (можно направлять трафик), по каждому из --runs
+запусков и медиану. Отдельно измеряется время импорта модуля приложения.
+
+    python -m backend.benchmarks.startup_time --runs 5
+    python -m backend.benchmarks.startup_time --cwd recommendation --port 8080 \\
+        --module main --cmd "uvicorn main:app --port 8080"
+"""
+import argparse
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def import_time(module: str, cwd: str) -> float:
+    # Отдельный интерпретатор, чтобы модуль и его зависимости не были уже загружены
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=cwd, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return 0
+
+
+def run_once(cmd: str, cwd: str, base_url: str, timeout: float) -> tuple:
+    started = time.perf_counter()
+    process = subprocess.Popen(shlex.split(cmd), cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live_at = ready_at = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+            if live_at is None and status(f"{base_url}/live") == 200:
+                live_at = time.perf_counter() - started
+            if live_at is not None and status(f"{base_url}/ready") == 200:
+                ready_at = time.perf_counter() - started
+                break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        process.wait()
+    return live_at, ready_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cmd", default="uvicorn backend.main:app --port 8000")
+    parser.add_argument("--cwd", default=".")
+    parser.add_argument("--module", default="backend.main", help="модуль приложения для замера импорта")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    print(f"Импорт {args.module}: {import_time(args.module, args.cwd):.2f} с")
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    lives, readies = [], []
+    for i in range(args.runs):
+        live_at, ready_at = run_once(args.cmd, args.cwd, base_url, args.timeout)
+        print(f"Запуск {i + 1}: /live {live_at if live_at is None else f'{live_at:.2f} с'}, "
+              f"/ready {ready_at if ready_at is None else f'{ready_at:.2f} с'}")
+        if live_at is not None:
+            lives.append(live_at)
+        if ready_at is not None:
+            readies.append(ready_at)
+
+    if lives:
+        print(f"Медиана до /live: {statistics.median(lives):.2f} с")
+    if readies:
+        print(f"Медиана до /ready: {statistics.median(readies):.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend import models
+
+# 🔹 Версия каталога событий и кэш сериализованных ответов /events/.
+# Каждое изменение каталога (создание/удаление события, продажа билетов,
+# сверка остатков) пишется в журнал event_changes, поэтому версия берётся из
+# него: «последний id — число записей». Число записей меняется и тогда, когда
+# транзакция с меньшим id фиксируется позже, а одинаковая версия у всех
+# воркеров даёт одинаковый ETag. Журнал перечитывается не чаще раза в
+# VERSION_CHECK_INTERVAL секунд; изменение в своём процессе (bump_version)
+# заставляет перечитать его при следующем запросе.
+
+VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "1"))
+# Максимальный возраст записи кэша в секундах (0 — без ограничения)
+CACHE_MAX_AGE = float(os.getenv("CATALOG_CACHE_MAX_AGE", "0"))
+CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "256"))
+
+_lock = threading.Lock()
+_version = "0-0"
+_checked_at = 0.0
+_modified_at = time.time()
+_bodies: "OrderedDict[tuple, tuple[float, Any]]" = OrderedDict()
+
+
+def current_version(db: Session) -> str:
+    """Версия каталога; при смене сбрасывает кэш ответов."""
+    global _version, _checked_at, _modified_at
+    if time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _version
+    last_id, count = db.query(func.max(models.EventChange.id), func.count(models.EventChange.id)).one()
+    version = f"{last_id or 0}-{count}"
+    with _lock:
+        _checked_at = time.monotonic()
+        if version != _version:
+            _version = version
+            _modified_at = time.time()
+            _bodies.clear()
+    return version
+
+
+def bump_version():
+    """Отмечает изменение каталога в этом процессе: версия перечитывается при следующем запросе."""
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
+
+
+def etag(version: Optional[str] = None) -> str:
+    return f'"{version or _version}"'
+
+
+def last_modified() -> str:
+    return formatdate(_modified_at, usegmt=True)
+
+
+def validators(version: Optional[str] = None) -> dict:
+    return {"ETag": etag(version), "Last-Modified": last_modified(), "Cache-Control": "no-cache"}
+
+
+def matches(if_none_match: Optional[str], version: Optional[str] = None) -> bool:
+    """True, если клиент уже имеет актуальную версию (заголовок If-None-Match)."""
+    if not if_none_match:
+        return False
+    current = etag(version)
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or current in tags
+
+
+def get_body(key: tuple) -> Optional[Any]:
+    with _lock:
+        entry = _bodies.get((_version, key))
+        if entry is None:
+            return None
+        stored_at, body = entry
+        if CACHE_MAX_AGE and time.time() - stored_at > CACHE_MAX_AGE:
+            del _bodies[(_version, key)]
+            return None
+        _bodies.move_to_end((_version, key))
+        return body
+
+
+def put_body(version: str, key: tuple, body: Any):
+    """Кэширует тело ответа, если каталог не менялся с начала запроса."""
+    with _lock:
+        if version != _version:
+            return
+        _bodies[(version, key)] = (time.time(), body)
+        while len(_bodies) > CACHE_MAX_ENTRIES:
+            _bodies.popitem(last=False)
@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from backend import catalog, models
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Журнал изменений каталога (event_changes) и лента /events/changes.
+# id записи выдаётся последовательностью при вставке, а видимой запись
+# становится при коммите. Если две транзакции зафиксируются не в порядке id,
+# клиент, продвинувший курсор за ещё не зафиксированный id, никогда не увидит
+# это изменение. Поэтому лента отдаёт записи только до «безопасной границы»:
+# останавливается на первой записи моложе LAG_SECONDS — транзакции с
+# изменениями каталога короткие и успевают зафиксироваться за это время.
+
+LAG_SECONDS = float(os.getenv("CHANGE_FEED_LAG_SECONDS", "5"))
+# Записи старше RETENTION_HOURS удаляются, наибольший удалённый id хранится в
+# event_changes_pruned; клиент с курсором ниже него получает 410 и загружает
+# каталог целиком. Пропуски id (откаченные транзакции) на это не влияют
+RETENTION_HOURS = float(os.getenv("EVENT_CHANGES_RETENTION_HOURS", "168"))
+PRUNE_INTERVAL = float(os.getenv("EVENT_CHANGES_PRUNE_SECONDS", "3600"))
+
+
+def horizon() -> datetime:
+    """Записи, созданные позже этого момента, ещё не отдаются в ленту."""
+    return datetime.utcnow() - timedelta(seconds=LAG_SECONDS)
+
+
+def changes_since(db: Session, since: int, limit: int) -> tuple[list, bool, int]:
+    """
+    Записи журнала после since, не дальше безопасной границы.
+
+    Возвращает (записи, есть ли ещё, новый курсор).
+    """
+    cutoff = horizon()
+    rows = (
+        db.query(models.EventChange.id, models.EventChange.event_id, models.EventChange.created_at)
+        .filter(models.EventChange.id > since)
+        .order_by(models.EventChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    # Останавливаемся на первой записи внутри окна (записи идут по id)
+    fresh = next((i for i, row in enumerate(rows) if row.created_at and row.created_at > cutoff), None)
+    if fresh is not None:
+        return rows[:fresh], False, rows[fresh - 1].id if fresh else since
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, has_more, rows[-1].id if rows else since
+
+
+def pruned_max(db: Session) -> int:
+    """Наибольший id, удалённый по сроку хранения (0, если журнал не очищался)."""
+    return db.query(models.EventChangesPruned.max_id).filter(models.EventChangesPruned.id == 1).scalar() or 0
+
+
+def safe_version(db: Session) -> int:
+    """Курсор, до которого все записи журнала уже зафиксированы (для X-Change-Version)."""
+    first_fresh = (
+        db.query(func.min(models.EventChange.id))
+        .filter(models.EventChange.created_at > horizon())
+        .scalar()
+    )
+    if first_fresh is not None:
+        return first_fresh - 1
+    # Пустой после очистки журнал не должен возвращать курсор к 0
+    return max(db.query(func.max(models.EventChange.id)).scalar() or 0, pruned_max(db))
+
+
+def is_pruned(db: Session, since: int) -> bool:
+    """True, если записи после since уже удалены по сроку хранения."""
+    return since < pruned_max(db)
+
+
+def prune(db: Session) -> int:
+    """Удаляет записи старше RETENTION_HOURS; возвращает число удалённых."""
+    cutoff = datetime.utcnow() - timedelta(hours=RETENTION_HOURS)
+    last_id = (
+        db.query(func.max(models.EventChange.id))
+        .filter(models.EventChange.created_at < cutoff)
+        .scalar()
+    )
+    if last_id is None:
+        return 0
+    # Удаляется всё до last_id включительно, поэтому курсор >= last_id ничего не пропускает
+    deleted = (
+        db.query(models.EventChange)
+        .filter(models.EventChange.id <= last_id)
+        .delete(synchronize_session=False)
+    )
+    statement = insert(models.EventChangesPruned).values(id=1, max_id=last_id)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.EventChangesPruned.id],
+        set_={"max_id": func.greatest(models.EventChangesPruned.max_id, statement.excluded.max_id)},
+    ))
+    db.commit()
+    if deleted:
+        catalog.bump_version()
+    return deleted
+
+
+def start_pruner(session_factory, interval: float = PRUNE_INTERVAL) -> threading.Event:
+    """Фоновая периодическая очистка журнала; установка возвращённого Event останавливает поток."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            db = session_factory()
+            try:
+                deleted = prune(db)
+                if deleted:
+                    logger.info(f"Pruned {deleted} event changes")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Event change log pruning failed: {e}")
+            finally:
+                db.close()
+
+    threading.Thread(target=loop, name="event-changes-pruner", daemon=True).start()
+    return stop
@@ -1,32 +1,8 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
 
-# 🔹 Получаем настройки из окружения
-DB_USER = os.getenv("DB_USER", "postgres")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "1234")
-DB_HOST = os.getenv("DB_HOST", "db")  # ⚠️ Теперь указываем "db", а не "localhost"
-DB_PORT = os.getenv("DB_PORT", "5432")
-DB_NAME = os.getenv("DB_NAME", "event_platform")
+# 🔹 Подключение к БД и пул соединений настраиваются в backend/database.py;
+# здесь они реэкспортируются для существующих импортов
+from backend.database import SQLALCHEMY_DATABASE_URL, engine, SessionLocal, Base, get_db  # noqa: F401
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
-
-# 🔹 Формируем строку подключения
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-# 🔹 Создаем движок для подключения к БД
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-
-# 🔹 Создаем сессию для работы с БД
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 🔹 Базовый класс для моделей
-Base = declarative_base()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
@@ -1,6 +1,8 @@
-from sqlalchemy.orm import Session
-from backend import models, schemas
-from passlib.context import CryptContext
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from backend import models, schemas, catalog, inventory, security, hashing
 from fastapi import HTTPException
 
 # Создание пользователя
@@ -33,6 +35,22 @@ def get_user_by_email(db: Session, email: str):
 def get_users(db: Session):
     return db.query(models.User).all()
 
+# 🔹 Списки для быстрой сериализации (backend/fastjson.py): только колонки
+# схемы ответа, кортежами, без создания ORM-объектов
+USER_FIELDS = tuple(schemas.UserOut.model_fields)
+TICKET_FIELDS = tuple(schemas.TicketOut.model_fields)
+
+def get_user_rows(db: Session):
+    return db.query(*[getattr(models.User, f) for f in USER_FIELDS]).order_by(models.User.id).all()
+
+def get_user_ticket_rows(db: Session, user_id: int):
+    return (
+        db.query(*[getattr(models.Ticket, f) for f in TICKET_FIELDS])
+        .filter(models.Ticket.user_id == user_id)
+        .order_by(models.Ticket.id)
+        .all()
+    )
+
 # Создание события
 def create_event(db: Session, event: schemas.EventCreate):
     db_event = models.Event(
@@ -43,10 +61,17 @@ def create_event(db: Session, event: schemas.EventCreate):
         price=event.price
     )
     db.add(db_event)
+    db.flush()
+    record_event_change(db, db_event.id, "created")
     db.commit()
     db.refresh(db_event)
+    catalog.bump_version()
     return db_event
 
+# 🔹 Запись в журнал изменений каталога (коммитится вместе с самим изменением)
+def record_event_change(db: Session, event_id: int, change_type: str):
+    db.add(models.EventChange(event_id=event_id, change_type=change_type))
+
 # Получение всех событий
 def get_events(db: Session):
     return db.query(models.Event).all()
@@ -55,15 +80,121 @@ def get_events(db: Session):
 def get_event(db: Session, event_id: int):
     return db.query(models.Event).filter(models.Event.id == event_id).first()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Функция хеширования пароля
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-# Проверка пароля
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# 🔹 Билеты пользователя; with_events подгружает события тем же запросом (JOIN)
+def get_user_tickets(db: Session, user_id: int, with_events: bool = False):
+    query = db.query(models.Ticket).filter(models.Ticket.user_id == user_id)
+    if with_events:
+        query = query.options(joinedload(models.Ticket.event))
+    return query.order_by(models.Ticket.id).all()
+
+# 🔹 Покупка билета. Остаток уменьшается одним условным UPDATE ... RETURNING
+# (без чтения перед записью, поэтому продать больше билетов, чем есть, нельзя),
+# билет вставляется в той же транзакции. Для «горячих» событий списание идёт
+# из частей остатка (см. backend/inventory.py)
+def purchase_ticket(db: Session, user_id: int, event_id: int) -> models.Ticket:
+    remaining = inventory.take_stock(db, event_id, 1)
+
+    if remaining is None:
+        db.rollback()
+        if get_event(db, event_id) is None:
+            raise HTTPException(status_code=404, detail="Событие не найдено!")
+        raise HTTPException(status_code=400, detail="Билеты закончились!")
+
+    ticket = models.Ticket(user_id=user_id, event_id=event_id, purchase_date=datetime.utcnow())
+    db.add(ticket)
+    if remaining != inventory.SHARDED:
+        # Остаток «горячих» событий попадает в журнал при сверке
+        record_event_change(db, event_id, "availability")
+    try:
+        db.commit()
+    except IntegrityError:
+        # Внешний ключ на users: откатываем и списание билета
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    catalog.bump_version()
+    return ticket
+
+# 🔹 Групповая покупка в одной транзакции: по одному условному UPDATE на событие
+# и одна многострочная вставка билетов. Если хотя бы одну позицию выполнить
+# нельзя, откатывается всё. Возвращает (успех, результаты по позициям)
+def purchase_tickets_bulk(db: Session, user_id: int, items: list[schemas.TicketOrderLine]):
+    quantities: dict[int, int] = {}
+    for item in items:
+        quantities[item.event_id] = quantities.get(item.event_id, 0) + item.quantity
+
+    # Единый порядок блокировок строк events исключает взаимные блокировки
+    remaining: dict[int, int] = {}
+    failed = []
+    for event_id in sorted(quantities):
+        left = inventory.take_stock(db, event_id, quantities[event_id])
+        if left is None:
+            failed.append(event_id)
+        else:
+            remaining[event_id] = left
+
+    if failed:
+        db.rollback()
+        current = dict(
+            db.query(models.Event.id, models.Event.available_tickets)
+            .filter(models.Event.id.in_(failed))
+            .all()
+        )
+        lines = []
+        for event_id, quantity in quantities.items():
+            if event_id not in failed:
+                status, available = "rolled_back", None
+            elif event_id not in current:
+                status, available = "not_found", None
+            else:
+                status, available = "sold_out", current[event_id]
+            lines.append(schemas.TicketLineResult(event_id=event_id, quantity=quantity,
+                                                  status=status, available_tickets=available))
+        return False, lines
+
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "event_id": event_id, "purchase_date": now}
+        for event_id, quantity in quantities.items()
+        for _ in range(quantity)
+    ]
+    try:
+        inserted = db.execute(
+            insert(models.Ticket).returning(models.Ticket.id, models.Ticket.event_id,
+                                            sort_by_parameter_order=True),
+            rows,
+        ).all()
+        for event_id in quantities:
+            if remaining[event_id] != inventory.SHARDED:
+                record_event_change(db, event_id, "availability")
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    catalog.bump_version()
+
+    ticket_ids: dict[int, list[int]] = {event_id: [] for event_id in quantities}
+    for ticket_id, event_id in inserted:
+        ticket_ids[event_id].append(ticket_id)
+    lines = [
+        schemas.TicketLineResult(event_id=event_id, quantity=quantity, status="ok",
+                                 available_tickets=None if remaining[event_id] == inventory.SHARDED else remaining[event_id],
+                                 ticket_ids=ticket_ids[event_id])
+        for event_id, quantity in quantities.items()
+    ]
+    return True, lines
+
+# Хеширование и проверка паролей выполняются в отдельном пуле (см. hashing.py)
+hash_password = hashing.hash_password
+verify_password = hashing.verify_password
+
+# 🔹 Проверка пароля при входе. Хеш пересчитывается, если изменилась стоимость
+# bcrypt, а пароль, сохранённый открытым текстом, заменяется хешем
+def check_user_password(db: Session, user: models.User, password: str) -> bool:
+    valid, new_hash = hashing.verify_and_update(password, user.password)
+    if valid and new_hash:
+        user.password = new_hash
+        db.commit()
+    return valid
 
 # Создание пользователя с хешированием пароля
 def create_user(db: Session, user: schemas.UserCreate):
@@ -77,7 +208,7 @@ def create_user(db: Session, user: schemas.UserCreate):
 # Проверка пользователя по email
 def authenticate_user(db: Session, email: str, password: str):
     user = db.query(models.User).filter(models.User.email == email).first()
-    if not user or not verify_password(password, user.password):
+    if not user or not check_user_password(db, user, password):
         return None
     return user
 
@@ -96,6 +227,7 @@ def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
     user.email = user_update.email
     db.commit()
     db.refresh(user)
+    security.principal_cache.invalidate_user(user_id)
     return user
 
 # 🔹 Смена пароля пользователя
@@ -112,6 +244,7 @@ def change_user_password(db: Session, user_id: int, old_password: str, new_passw
     user.password = hash_password(new_password)
     db.commit()
     db.refresh(user)
+    security.principal_cache.invalidate_user(user_id)
     return {"message": "Пароль успешно изменен"}
 
 def get_user_by_email(db: Session, email: str):
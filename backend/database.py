@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool, QueuePool
+
+# 🔹 Единая точка подключения бэкенда к БД: движок, пул соединений, сессии.
+# Все настройки пула берутся из окружения.
+
+DB_USER = os.getenv("DB_USER", "postgres")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "1234")
+DB_HOST = os.getenv("DB_HOST", "db")  # ⚠️ Теперь указываем "db", а не "localhost"
+DB_PORT = os.getenv("DB_PORT", "5432")
+DB_NAME = os.getenv("DB_NAME", "event_platform")
+
+SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Сколько ждать свободное соединение
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Пересоздавать соединения старше (сек)
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 — без ограничения
+# Режим для PgBouncer (transaction pooling): пулом занимается PgBouncer, поэтому
+# соединения не держатся на стороне приложения, а statement_timeout задаётся
+# через SET LOCAL в каждой транзакции (параметры старта PgBouncer не пропускает)
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    """Время ожидания соединения из пула и число ожиданий, превысивших порог."""
+
+    SLOW_CHECKOUT = 0.1  # Секунды
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+
+    def observe(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited >= self.SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class _TimedPoolMixin:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            pool_metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.observe(time.perf_counter() - started)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedPoolMixin, NullPool):
+    pass
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL):
+    if PGBOUNCER:
+        db_engine = create_engine(url, poolclass=TimedNullPool)
+        if STATEMENT_TIMEOUT_MS:
+            @event.listens_for(db_engine, "begin")
+            def set_statement_timeout(conn):
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+        return db_engine
+
+    connect_args = {}
+    if STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+# 🔹 Создаем движок для подключения к БД
+engine = create_db_engine()
+
+# 🔹 Создаем сессию для работы с БД
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# 🔹 Базовый класс для моделей
+Base = declarative_base()
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def wait_for_db(retries: int = 30, interval: float = 2) -> bool:
+    """Ждёт, пока БД начнёт принимать соединения (через общий движок)."""
+    while retries > 0:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            print("✅ Database is ready!")
+            return True
+        except OperationalError:
+            print(f"⏳ Waiting for database to start... {retries} retries left")
+            time.sleep(interval)
+            retries -= 1
+    print("❌ Could not connect to the database!")
+    return False
+
+
+def pool_status() -> dict:
+    """Состояние пула и метрики ожидания соединений."""
+    status = {
+        "mode": "pgbouncer" if PGBOUNCER else "pool",
+        "checkouts": pool_metrics.checkouts,
+        "checkout_wait_avg_ms": round(pool_metrics.wait_total / pool_metrics.checkouts * 1000, 3)
+        if pool_metrics.checkouts else 0.0,
+        "checkout_wait_max_ms": round(pool_metrics.wait_max * 1000, 3),
+        "slow_checkouts": pool_metrics.slow_checkouts,
+        "checkout_timeouts": pool_metrics.timeouts,
+    }
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + MAX_OVERFLOW
+        status.update({
+            "size": pool.size(),
+            "max_overflow": MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+        })
+    return status
@@ -1,11 +1,72 @@
+import hmac
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 🔹 Хеширование паролей в отдельном ограниченном пуле потоков.
+# bcrypt отпускает GIL на время вычисления, поэтому потоков достаточно;
+# размер пула ограничивает долю CPU, которую могут занять логины, а очередь
+# ограничена: при её переполнении запрос сразу получает 503, а не ждёт.
+
+# Стоимость bcrypt; хеши с другой стоимостью пересчитываются при следующем входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE", "16"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_LIMIT)
+
+
+class HashingOverloaded(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Сервис перегружен, повторите вход позже",
+                         headers={"Retry-After": "1"})
+
+
+def _submit(fn, *args) -> Future:
+    if not _slots.acquire(blocking=False):
+        raise HashingOverloaded()
+    try:
+        future = _executor.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return _submit(pwd_context.hash, password).result()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return _submit(pwd_context.verify, plain_password, hashed_password).result()
+
+
+def verify_and_update(plain_password: str, stored_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль и возвращает (верен ли, новый хеш или None).
+
+    Новый хеш возвращается, если сохранённый посчитан с другой стоимостью
+    bcrypt или пароль хранится открытым текстом (старые регистрации).
+    """
+    if not stored_password:
+        return False, None
+    if pwd_context.identify(stored_password, required=False) is None:
+        if hmac.compare_digest(plain_password.encode(), stored_password.encode()):
+            return True, hash_password(plain_password)
+        return False, None
+    return _submit(pwd_context.verify_and_update, plain_password, stored_password).result()
+
@@ -0,0 +1,20 @@
+import sys
+
+from backend import models  # noqa: F401  (регистрирует таблицы в Base.metadata)
+from backend.database import Base, engine, wait_for_db
+
+# 🔹 Создание схемы БД отдельным процессом перед запуском сервера:
+#     python -m backend.init_db && uvicorn backend.main:app
+# Так воркеры uvicorn стартуют без ожидания БД и без create_all при импорте.
+
+
+def main() -> int:
+    if not wait_for_db():
+        return 1
+    Base.metadata.create_all(bind=engine)
+    print("✅ Database tables created successfully")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
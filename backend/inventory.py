@@ -0,0 +1,223 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy import func, text, update
+from sqlalchemy.orm import Session
+
+from backend import catalog, models
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Остаток билетов для «горячих» событий.
+# В обычном режиме билеты списываются условным UPDATE строки events. На старте
+# продаж популярного события все покупки упираются в блокировку этой одной
+# строки, поэтому для него остаток можно разбить на N строк event_stock_shards:
+# каждая покупка блокирует случайную свободную часть (FOR UPDATE SKIP LOCKED),
+# а если свободных нет — ждёт одну случайную часть, и покупки идут
+# параллельно. events.available_tickets в этом режиме периодически сверяется
+# с суммой частей (reconcile).
+
+# Возвращается take_stock при успешном списании из частей остатка:
+# точный общий остаток в этом случае не вычисляется
+SHARDED = -1
+
+RECONCILE_INTERVAL = float(os.getenv("INVENTORY_RECONCILE_SECONDS", "5"))
+# Сколько раз покупка ждёт блокировки одной части, прежде чем блокировать все
+SHARD_LOCK_ATTEMPTS = int(os.getenv("INVENTORY_SHARD_LOCK_ATTEMPTS", "3"))
+
+
+def take_stock(db: Session, event_id: int, quantity: int) -> Optional[int]:
+    """
+    Списывает quantity билетов в текущей транзакции.
+
+    Возвращает новый остаток (или SHARDED для «горячего» события) либо None,
+    если события нет или билетов не хватает.
+    """
+    for _ in range(2):
+        remaining = db.execute(
+            update(models.Event)
+            .where(models.Event.id == event_id,
+                   models.Event.stock_shards == 0,
+                   models.Event.available_tickets >= quantity)
+            .values(available_tickets=models.Event.available_tickets - quantity)
+            .returning(models.Event.available_tickets)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        if remaining is not None:
+            return remaining
+        if _stock_shards(db, event_id) and _take_from_shards(db, event_id, quantity):
+            return SHARDED
+
+        # Не вышло: либо билетов действительно нет, либо событие вернулось в
+        # обычный режим (disable_sharding) во время попытки — тогда повторяем
+        # по свежему состоянию, а не отвечаем ложным «распродано»
+        event = (
+            db.query(models.Event.stock_shards, models.Event.available_tickets)
+            .filter(models.Event.id == event_id)
+            .first()
+        )
+        if event is None or event.stock_shards or event.available_tickets < quantity:
+            return None
+    return None
+
+
+def _stock_shards(db: Session, event_id: int) -> Optional[int]:
+    return db.query(models.Event.stock_shards).filter(models.Event.id == event_id).scalar()
+
+
+def _take_from_shards(db: Session, event_id: int, quantity: int) -> bool:
+    # Быстрый путь: любая незаблокированная часть, где хватает билетов
+    shard = db.execute(text(
+        "SELECT shard FROM event_stock_shards "
+        "WHERE event_id = :event_id AND available >= :quantity "
+        "ORDER BY random() LIMIT 1 FOR UPDATE SKIP LOCKED"
+    ), {"event_id": event_id, "quantity": quantity}).scalar()
+
+    # Все подходящие части заняты (пик старта продаж): ждём одну случайную
+    # часть, а не все сразу. Пока ждали, её могли выкупить — тогда условие
+    # перепроверяется и строка не возвращается, пробуем другую
+    attempts = SHARD_LOCK_ATTEMPTS
+    while shard is None and attempts:
+        attempts -= 1
+        shard = db.execute(text(
+            "SELECT shard FROM event_stock_shards "
+            "WHERE event_id = :event_id AND available >= :quantity "
+            "ORDER BY random() LIMIT 1 FOR UPDATE"
+        ), {"event_id": event_id, "quantity": quantity}).scalar()
+        if shard is None and not _any_shard_fits(db, event_id, quantity):
+            break
+
+    if shard is not None:
+        db.execute(text(
+            "UPDATE event_stock_shards SET available = available - :quantity "
+            "WHERE event_id = :event_id AND shard = :shard"
+        ), {"event_id": event_id, "shard": shard, "quantity": quantity})
+        return True
+
+    # Медленный путь: заказ больше любой части (или остатка не хватает) —
+    # блокируем все части по порядку и списываем из нескольких
+    rows = db.execute(text(
+        "SELECT shard, available FROM event_stock_shards "
+        "WHERE event_id = :event_id ORDER BY shard FOR UPDATE"
+    ), {"event_id": event_id}).all()
+    if sum(available for _, available in rows) < quantity:
+        return False
+    left = quantity
+    for shard, available in rows:
+        if left == 0:
+            break
+        take = min(available, left)
+        if take:
+            db.execute(text(
+                "UPDATE event_stock_shards SET available = available - :take "
+                "WHERE event_id = :event_id AND shard = :shard"
+            ), {"event_id": event_id, "shard": shard, "take": take})
+            left -= take
+    return True
+
+
+def _any_shard_fits(db: Session, event_id: int, quantity: int) -> bool:
+    return db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM event_stock_shards "
+        "WHERE event_id = :event_id AND available >= :quantity)"
+    ), {"event_id": event_id, "quantity": quantity}).scalar()
+
+
+def enable_sharding(db: Session, event_id: int, shards: int) -> Optional[models.Event]:
+    """Переводит событие в режим частей: остаток делится поровну на shards строк."""
+    event = _lock_event(db, event_id)
+    if event is None:
+        return None
+    collapsed = bool(event.stock_shards)
+    if collapsed:
+        _collapse_shards(db, event)
+        # Остаток в events мог отставать от частей до сверки — фиксируем в журнале
+        db.add(models.EventChange(event_id=event_id, change_type="availability"))
+
+    base, extra = divmod(event.available_tickets, shards)
+    db.add_all([
+        models.EventStockShard(event_id=event_id, shard=i, available=base + (1 if i < extra else 0))
+        for i in range(shards)
+    ])
+    event.stock_shards = shards
+    db.commit()
+    if collapsed:
+        catalog.bump_version()
+    return event
+
+
+def disable_sharding(db: Session, event_id: int) -> Optional[models.Event]:
+    """Возвращает событие в обычный режим, собирая остаток обратно в events."""
+    event = _lock_event(db, event_id)
+    if event is None:
+        return None
+    if event.stock_shards:
+        _collapse_shards(db, event)
+        event.stock_shards = 0
+        # Остаток в events мог отставать от частей до сверки — фиксируем в журнале
+        db.add(models.EventChange(event_id=event_id, change_type="availability"))
+        db.commit()
+        catalog.bump_version()
+    return event
+
+
+def _lock_event(db: Session, event_id: int) -> Optional[models.Event]:
+    # FOR NO KEY UPDATE, а не FOR UPDATE: покупка из частей держит блокировку
+    # части и при вставке билета берёт FOR KEY SHARE на строку events (проверка
+    # внешнего ключа). FOR UPDATE с ней конфликтует, и Postgres обрывает одну
+    # из транзакций как взаимоблокировку; FOR NO KEY UPDATE — нет
+    return db.query(models.Event).filter(models.Event.id == event_id).with_for_update(key_share=True).first()
+
+
+def _collapse_shards(db: Session, event: models.Event):
+    rows = db.execute(text(
+        "SELECT available FROM event_stock_shards WHERE event_id = :event_id ORDER BY shard FOR UPDATE"
+    ), {"event_id": event.id}).scalars().all()
+    event.available_tickets = sum(rows)
+    db.query(models.EventStockShard).filter(models.EventStockShard.event_id == event.id).delete()
+
+
+def reconcile(db: Session) -> int:
+    """Записывает в events.available_tickets сумму частей остатка; возвращает число обновлённых событий."""
+    totals = (
+        db.query(models.EventStockShard.event_id,
+                 func.sum(models.EventStockShard.available).label("total"))
+        .group_by(models.EventStockShard.event_id)
+        .subquery()
+    )
+    changed = db.execute(
+        update(models.Event)
+        .where(models.Event.id == totals.c.event_id,
+               models.Event.stock_shards > 0,
+               models.Event.available_tickets != totals.c.total)
+        .values(available_tickets=totals.c.total)
+        .returning(models.Event.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    for event_id in changed:
+        db.add(models.EventChange(event_id=event_id, change_type="availability"))
+    db.commit()
+    if changed:
+        catalog.bump_version()
+    return len(changed)
+
+
+def start_reconciler(session_factory, interval: float = RECONCILE_INTERVAL) -> threading.Event:
+    """Фоновая периодическая сверка; установка возвращённого Event останавливает поток."""
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            db = session_factory()
+            try:
+                reconcile(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Inventory reconciliation failed: {e}")
+            finally:
+                db.close()
+
+    threading.Thread(target=loop, name="inventory-reconciler", daemon=True).start()
+    return stop
@@ -0,0 +1,34 @@
+"""Event change log
+
+Revision ID: 3e5b9c0d1f27
+Revises: 8c1f2d7a9b34
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e5b9c0d1f27'
+down_revision: Union[str, None] = '8c1f2d7a9b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('event_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('change_type', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_event_changes_event_id', 'event_changes', ['event_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_event_changes_event_id', table_name='event_changes')
+    op.drop_table('event_changes')
@@ -0,0 +1,31 @@
+"""Event keyset pagination indexes
+
+Revision ID: 8c1f2d7a9b34
+Revises: 415106206287
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f2d7a9b34'
+down_revision: Union[str, None] = '415106206287'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_events_date_id', 'events', ['date', 'id'], unique=False)
+    op.create_index('ix_events_category_date_id', 'events', ['category', 'date', 'id'], unique=False)
+    op.create_index('ix_events_available_date_id', 'events', ['date', 'id'], unique=False,
+                    postgresql_where=sa.text('available_tickets > 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_events_available_date_id', table_name='events')
+    op.drop_index('ix_events_category_date_id', table_name='events')
+    op.drop_index('ix_events_date_id', table_name='events')
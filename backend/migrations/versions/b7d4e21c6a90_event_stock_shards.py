@@ -0,0 +1,34 @@
+"""Sharded stock for hot events
+
+Revision ID: b7d4e21c6a90
+Revises: 3e5b9c0d1f27
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d4e21c6a90'
+down_revision: Union[str, None] = '3e5b9c0d1f27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('events', sa.Column('stock_shards', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('event_stock_shards',
+    sa.Column('event_id', sa.Integer(), nullable=False),
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('available', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('event_id', 'shard')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_stock_shards')
+    op.drop_column('events', 'stock_shards')
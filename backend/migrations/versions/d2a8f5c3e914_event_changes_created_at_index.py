@@ -0,0 +1,25 @@
+"""Index on event_changes.created_at for the change feed horizon and retention
+
+Revision ID: d2a8f5c3e914
+Revises: b7d4e21c6a90
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f5c3e914'
+down_revision: Union[str, None] = 'b7d4e21c6a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_event_changes_created_at', 'event_changes', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_event_changes_created_at', table_name='event_changes')
@@ -0,0 +1,30 @@
+"""Watermark of event_changes rows removed by retention
+
+Revision ID: e6b1c4a7d052
+Revises: d2a8f5c3e914
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b1c4a7d052'
+down_revision: Union[str, None] = 'd2a8f5c3e914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('event_changes_pruned',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('max_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('event_changes_pruned')
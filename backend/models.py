@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Index, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from backend.config import Base
 from datetime import datetime
@@ -29,8 +29,18 @@ class Event(Base):
     category = Column(String, nullable=True)  # Категория
     available_tickets = Column(Integer, nullable=False)  # Доступные билеты
     total_tickets = Column(Integer, nullable=False)
+    # Число частей остатка для «горячих» событий (0 — обычный режим, см. backend/inventory.py)
+    stock_shards = Column(Integer, nullable=False, default=0, server_default="0")
     tickets = relationship("Ticket", back_populates="event")
 
+    # Индексы под keyset-пагинацию по (date, id) и фильтры списка событий
+    __table_args__ = (
+        Index("ix_events_date_id", "date", "id"),
+        Index("ix_events_category_date_id", "category", "date", "id"),
+        Index("ix_events_available_date_id", "date", "id",
+              postgresql_where=available_tickets > 0),
+    )
+
 # Таблица билетов
 class Ticket(Base):
     __tablename__ = "tickets"
@@ -43,3 +53,34 @@ class Ticket(Base):
     user = relationship("User", back_populates="tickets")
     event = relationship("Event", back_populates="tickets")
 
+
+
+# Журнал изменений каталога (только добавление): id служит курсором версии для /events/changes
+class EventChange(Base):
+    __tablename__ = "event_changes"
+
+    id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, nullable=False, index=True)
+    change_type = Column(String, nullable=False)  # created / updated / deleted / availability
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+# Наибольший id, удалённый из event_changes по сроку хранения (одна строка, id = 1):
+# курсор ленты не опускается ниже него, а курсор старше него получает 410
+class EventChangesPruned(Base):
+    __tablename__ = "event_changes_pruned"
+
+    id = Column(Integer, primary_key=True)
+    max_id = Column(Integer, nullable=False)
+
+
+# Части остатка билетов «горячего» события: покупки распределяются по строкам,
+# а не блокируют одну строку events
+class EventStockShard(Base):
+    __tablename__ = "event_stock_shards"
+
+    event_id = Column(Integer, ForeignKey("events.id", ondelete="CASCADE"), nullable=False)
+    shard = Column(Integer, nullable=False)
+    available = Column(Integer, nullable=False)
+
+    __table_args__ = (PrimaryKeyConstraint("event_id", "shard"),)
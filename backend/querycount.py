@@ -0,0 +1,42 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# 🔹 Счётчик SQL-запросов для тестов: проверяет, что эндпоинт выполняет
+# постоянное число запросов независимо от объёма данных (нет N+1)
+class QueryCounter:
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        return False
+
+
+@contextmanager
+def assert_max_queries(engine: Engine, limit: int):
+    """
+    Падает с AssertionError, если внутри блока выполнено больше limit запросов.
+
+        with assert_max_queries(engine, 2):
+            client.get(f"/tickets/{user_id}/events")
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = "\n".join(f"  {i + 1}. {s}" for i, s in enumerate(counter.statements))
+        raise AssertionError(f"Ожидалось не больше {limit} SQL-запросов, выполнено {counter.count}:\n{listing}")
@@ -0,0 +1,229 @@
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# 🔹 Время обработки каждого запроса по частям. Все SQL-запросы считаются и
+# замеряются через слушатели событий движка, остальные участки (сериализация)
+# — через timed(). Итог отдаётся в заголовке Server-Timing, запросы дольше
+# SLOW_REQUEST_MS пишутся в лог вместе со списком SQL, а во время каждого
+# PROFILE_SAMPLE_EVERY-го запроса снимаются стеки потоков процесса в каталог
+# PROFILE_DIR. Эндпоинты бэкенда синхронные и выполняются в пуле потоков,
+# поэтому используется только выборка стеков (cProfile видит один поток).
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))  # 0 — лог медленных запросов выключен
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))  # 0 — профилирование выключено
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/request-profiles")
+STACK_SAMPLE_INTERVAL = 0.005  # секунды
+MAX_RECORDED_QUERIES = 200
+MAX_LOGGED_QUERIES = 50
+
+
+class RequestTimings:
+    """Время по участкам одного запроса. Пишется из event loop и из потоков пула."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.sections: dict[str, float] = {}
+        self.query_count = 0
+        self.queries: list[tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.sections[name] = self.sections.get(name, 0.0) + seconds
+
+    def add_query(self, statement: str, seconds: float):
+        with self._lock:
+            self.sections["db"] = self.sections.get("db", 0.0) + seconds
+            self.query_count += 1
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append((statement, seconds))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        with self._lock:
+            sections = dict(self.sections)
+            count = self.query_count
+        parts = [f'db;dur={sections.pop("db", 0.0) * 1000:.1f};desc="{count} queries"']
+        parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sections.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed(name: str):
+    """Добавляет длительность блока к участку name текущего запроса; вне запроса ничего не делает."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def install_db_listeners(db_engine: Engine):
+    """Относит каждый SQL-запрос через db_engine к текущему HTTP-запросу."""
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("request_timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        timings = _current.get()
+        started = conn.info.get("request_timing_started")
+        if timings is not None and started:
+            timings.add_query(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(db_engine, "handle_error")
+    def failed(exception_context):
+        # Упавший запрос не доходит до after_cursor_execute
+        conn = exception_context.connection
+        started = conn.info.get("request_timing_started") if conn is not None else None
+        if started:
+            started.pop()
+
+
+# --- выборочное профилирование ---------------------------------------------
+# Выборка не привязана к запросу: снимаются стеки всех занятых потоков
+# процесса, пока запрос выполняется, включая одновременные с ним запросы.
+# Корень каждого стека — имя потока.
+
+# Верхние кадры стека потоков, которые ждут, а не работают
+_IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+                ("threading.py", "_wait_for_tstate_lock"), ("socket.py", "accept"),
+                ("thread.py", "_worker")}
+
+
+class StackSampler:
+    """Собирает стеки занятых потоков процесса в формате folded stacks (вход для flamegraph)."""
+
+    def __init__(self, interval: float = STACK_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# --- middleware -------------------------------------------------------------
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware: заголовок Server-Timing, лог медленных запросов и
+    выборочная запись стеков процесса во время запроса.
+
+    Заголовок добавляется в начале ответа, поэтому для потоковых ответов он
+    покрывает время до первого байта; лог медленных запросов учитывает полную
+    длительность вместе с телом.
+    """
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS,
+                 profile_every: int = PROFILE_SAMPLE_EVERY, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+        self.profile_every = profile_every
+        self.profile_dir = profile_dir
+        self._counter = itertools.count(1)
+        self._profiling = False  # Одна выборка за раз: вторая сняла бы те же стеки
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = None
+        if self.profile_every and next(self._counter) % self.profile_every == 0 and not self._profiling:
+            self._profiling = True
+            sampler = StackSampler()
+            sampler.start()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed_ms = timings.elapsed() * 1000
+            request_line = f"{scope['method']} {scope['path']}"
+            if sampler is not None:
+                self._write_profile(sampler, request_line, elapsed_ms)
+                self._profiling = False
+            if self.slow_request_ms and elapsed_ms >= self.slow_request_ms:
+                self._log_slow(timings, request_line, status["code"], elapsed_ms)
+
+    def _write_profile(self, sampler: StackSampler, request_line: str, elapsed_ms: float):
+        sampler.stop()
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = re.sub(r"[^A-Za-z0-9]+", "_", request_line).strip("_")
+            stem = f"{time.strftime('%Y%m%d-%H%M%S')}-process-during-{name}-{elapsed_ms:.0f}ms"
+            path = os.path.join(self.profile_dir, f"{stem}.folded")  # flamegraph.pl / speedscope
+            sampler.write(path)
+            logger.info(f"Стеки процесса во время {request_line} ({elapsed_ms:.1f} мс): {path}")
+        except OSError as e:
+            logger.warning(f"Не удалось записать стеки процесса: {e}")
+
+    def _log_slow(self, timings: RequestTimings, request_line: str, status: int, elapsed_ms: float):
+        lines = [f"Медленный запрос {request_line} -> {status}: {elapsed_ms:.1f} мс ({timings.server_timing()})"]
+        for i, (statement, seconds) in enumerate(timings.queries[:MAX_LOGGED_QUERIES]):
+            lines.append(f"  {i + 1}. {seconds * 1000:.1f} мс  {' '.join(statement.split())[:300]}")
+        if timings.query_count > MAX_LOGGED_QUERIES:
+            lines.append(f"  ... и ещё {timings.query_count - MAX_LOGGED_QUERIES}")
+        logger.warning("\n".join(lines))
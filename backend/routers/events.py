@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from backend.schemas import EventCreate, EventOut
+from backend.schemas import EventCreate, EventOut, EventChangesOut
 from backend.models import Event
 from backend.config import get_db
+from backend import catalog, changelog, crud, fastjson, inventory
+from backend.request_timing import timed
 
 router = APIRouter(
     prefix="/events",
@@ -14,14 +22,187 @@ router = APIRouter(
 def create_event(event: EventCreate, db: Session = Depends(get_db)):
     new_event = Event(**event.dict())
     db.add(new_event)
+    db.flush()
+    crud.record_event_change(db, new_event.id, "created")
     db.commit()
     db.refresh(new_event)
+    catalog.bump_version()
     return new_event
 
-# 🔹 Получение всех событий
+# Поля, доступные для проекции через ?fields=
+EVENT_FIELDS = tuple(EventOut.model_fields)
+# Максимальный размер страницы
+MAX_PAGE_SIZE = 1000
+
+# 🔹 Курсор keyset-пагинации: последняя пара (date, id) предыдущей страницы
+def encode_cursor(date: datetime, event_id: int) -> str:
+    raw = f"{date.isoformat()}|{event_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, event_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(date), int(event_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+def parse_fields(fields: str) -> list[str]:
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in EVENT_FIELDS]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+    return requested
+
+# 🔹 Запрос страницы событий, упорядоченной по (date, id)
+def query_events(
+    db: Session,
+    columns: Optional[list[str]] = None,
+    limit: Optional[int] = None,
+    after: Optional[tuple[datetime, int]] = None,
+    category: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    available: Optional[bool] = None,
+):
+    query = db.query(*[getattr(Event, c) for c in columns]) if columns else db.query(Event)
+    if category is not None:
+        query = query.filter(Event.category == category)
+    if date_from is not None:
+        query = query.filter(Event.date >= date_from)
+    if date_to is not None:
+        query = query.filter(Event.date <= date_to)
+    if available is True:
+        query = query.filter(Event.available_tickets > 0)
+    elif available is False:
+        query = query.filter(Event.available_tickets <= 0)
+    if after is not None:
+        query = query.filter(tuple_(Event.date, Event.id) > tuple_(*after))
+    query = query.order_by(Event.date, Event.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+# 🔹 Получение событий: фильтры, keyset-пагинация и проекция полей.
+# Без limit возвращается весь список; курсор следующей страницы — в заголовке X-Next-Cursor.
+# Ответ кэшируется в сериализованном виде для текущей версии каталога,
+# повторный запрос с If-None-Match получает 304 без обращения к БД.
+# X-Change-Version — курсор для последующих запросов к /events/changes
 @router.get("/", response_model=list[EventOut])
-def get_events(db: Session = Depends(get_db)):
-    return db.query(Event).all()
+def get_events(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    available: Optional[bool] = None,
+    fields: Optional[str] = Query(None, description="Список полей через запятую, например id,name,date"),
+    db: Session = Depends(get_db),
+):
+    version = catalog.current_version(db)
+    headers = catalog.validators(version)
+    if catalog.matches(request.headers.get("if-none-match"), version):
+        return Response(status_code=304, headers=headers)
+
+    cache_key = tuple(sorted(request.query_params.multi_items()))
+    cached = catalog.get_body(cache_key)
+    if cached is not None:
+        body, next_cursor, change_version = cached
+    else:
+        # Позиция в ленте изменений до чтения событий: клиент, продолживший
+        # с неё через /events/changes, не пропустит ни одного изменения
+        # (в том числе ещё не зафиксированного — см. backend/changelog.py)
+        change_version = changelog.safe_version(db)
+        after = decode_cursor(cursor) if cursor else None
+        requested = parse_fields(fields) if fields else None
+        # Быстрый путь выбирает колонки, а не ORM-объекты, даже без ?fields=
+        selected = requested or (list(EVENT_FIELDS) if fastjson.ENABLED else None)
+        # id и date нужны для курсора, даже если их не запросили
+        columns = list(dict.fromkeys(selected + ["id", "date"])) if selected else None
+
+        rows = query_events(db, columns, limit, after, category, date_from, date_to, available)
+
+        next_cursor = None
+        if limit is not None and len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1].date, rows[-1].id)
+
+        with timed("serialization"):
+            if fastjson.ENABLED:
+                body = fastjson.dumps(fastjson.rows_to_dicts(rows, selected))
+            else:
+                if requested:
+                    # Проекция отдаётся как есть, без валидации через EventOut
+                    items = [{f: getattr(row, f) for f in requested} for row in rows]
+                else:
+                    items = [EventOut.model_validate(row) for row in rows]
+                body = json.dumps(jsonable_encoder(items), ensure_ascii=False).encode()
+        catalog.put_body(version, cache_key, (body, next_cursor, change_version))
+
+    headers["X-Change-Version"] = str(change_version)
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# 🔹 Лента изменений каталога: события, созданные, изменённые, удалённые
+# или сменившие число доступных билетов после версии since.
+# Несколько изменений одного события схлопываются в его текущее состояние.
+# Отдаются только изменения до безопасной границы (changelog.LAG_SECONDS);
+# если журнал после since уже очищен — 410, клиент загружает каталог целиком
+@router.get("/changes", response_model=EventChangesOut)
+def get_event_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    requested = parse_fields(fields) if fields else None
+
+    if changelog.is_pruned(db, since):
+        raise HTTPException(status_code=410, detail="Журнал изменений после since уже очищен")
+    changes, has_more, version = changelog.changes_since(db, since, limit)
+
+    changed_ids = list(dict.fromkeys(c.event_id for c in changes))
+    events = []
+    if changed_ids:
+        columns = list(dict.fromkeys(requested + ["id"])) if requested else None
+        query = db.query(*[getattr(Event, c) for c in columns]) if columns else db.query(Event)
+        events = query.filter(Event.id.in_(changed_ids)).all()
+    present = {e.id for e in events}
+
+    if requested:
+        upserted = [{f: getattr(e, f) for f in requested} for e in events]
+    else:
+        upserted = [EventOut.model_validate(e).model_dump() for e in events]
+    return {
+        "since": since,
+        "version": version,
+        "has_more": has_more,
+        "upserted": upserted,
+        "deleted": [event_id for event_id in changed_ids if event_id not in present],
+    }
+
+# 🔹 Режим «горячего» события: остаток делится на shards частей, чтобы покупки
+# не упирались в блокировку одной строки events
+@router.post("/{event_id}/inventory/shards", response_model=EventOut)
+def enable_stock_sharding(event_id: int, shards: int = Query(16, ge=2, le=256), db: Session = Depends(get_db)):
+    event = inventory.enable_sharding(db, event_id, shards)
+    if not event:
+        raise HTTPException(status_code=404, detail="Событие не найдено")
+    return event
+
+# 🔹 Возврат события в обычный режим остатка
+@router.delete("/{event_id}/inventory/shards", response_model=EventOut)
+def disable_stock_sharding(event_id: int, db: Session = Depends(get_db)):
+    event = inventory.disable_sharding(db, event_id)
+    if not event:
+        raise HTTPException(status_code=404, detail="Событие не найдено")
+    return event
+
+# 🔹 Немедленная сверка остатков «горячих» событий (обычно идёт в фоне)
+@router.post("/inventory/reconcile")
+def reconcile_stock(db: Session = Depends(get_db)):
+    return {"updated_events": inventory.reconcile(db)}
 
 # 🔹 Получение события по ID
 @router.get("/{event_id}", response_model=EventOut)
@@ -39,5 +220,7 @@ def delete_event(event_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Событие не найдено")
     
     db.delete(event)
+    crud.record_event_change(db, event_id, "deleted")
     db.commit()
+    catalog.bump_version()
     return {"message": "Событие удалено"}
@@ -0,0 +1,39 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Query, Request
+from sqlalchemy import select
+from backend.config import SessionLocal
+from backend.models import Event, Ticket, User
+from backend.routers.events import EVENT_FIELDS
+from backend import crud, streaming
+
+router = APIRouter(
+    prefix="/export",
+    tags=["Export"]
+)
+
+# 🔹 Потоковая выгрузка таблиц для аналитики и офлайн-обучения.
+# Строки идут в порядке id; after_id позволяет забирать только новые строки.
+Format = Literal["ndjson", "csv"]
+
+
+def _export(request: Request, model, fields, fmt: str, name: str, after_id: Optional[int]):
+    statement = select(*[getattr(model, f) for f in fields]).order_by(model.id)
+    if after_id is not None:
+        statement = statement.where(model.id > after_id)
+    return streaming.export_response(request, SessionLocal, statement, fields, fmt, name)
+
+
+# Пароли не выгружаются: только поля UserOut
+@router.get("/users")
+def export_users(request: Request, format: Format = Query("ndjson"), after_id: Optional[int] = None):
+    return _export(request, User, crud.USER_FIELDS, format, "users", after_id)
+
+
+@router.get("/events")
+def export_events(request: Request, format: Format = Query("ndjson"), after_id: Optional[int] = None):
+    return _export(request, Event, EVENT_FIELDS, format, "events", after_id)
+
+
+@router.get("/tickets")
+def export_tickets(request: Request, format: Format = Query("ndjson"), after_id: Optional[int] = None):
+    return _export(request, Ticket, crud.TICKET_FIELDS, format, "tickets", after_id)
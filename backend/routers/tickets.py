@@ -1,35 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Response
 from sqlalchemy.orm import Session
-from backend.schemas import TicketCreate, TicketOut
-from backend.models import Ticket, Event, User
+from backend.schemas import TicketCreate, TicketOut, TicketWithEventOut, BulkTicketRequest, BulkTicketResult
 from backend.config import get_db
-from datetime import datetime
+from backend import crud, fastjson
 
 router = APIRouter(
     prefix="/tickets",
     tags=["Tickets"]
 )
 
-# 🔹 Покупка билета
+# 🔹 Покупка билета (списывает билет из остатка события)
 @router.post("/", response_model=TicketOut)
 def buy_ticket(ticket: TicketCreate, db: Session = Depends(get_db)):
-    event = db.query(Event).filter(Event.id == ticket.event_id).first()
-    user = db.query(User).filter(User.id == ticket.user_id).first()
-    
-    if not event or not user:
-        raise HTTPException(status_code=404, detail="Событие или пользователь не найдены")
-    
-    new_ticket = Ticket(user_id=ticket.user_id, event_id=ticket.event_id, purchase_date=datetime.utcnow())
-    db.add(new_ticket)
-    db.commit()
-    db.refresh(new_ticket)
-    return new_ticket
+    return crud.purchase_ticket(db, ticket.user_id, ticket.event_id)
+
+# 🔹 Групповая покупка: несколько билетов и/или несколько событий за один запрос.
+# Всё или ничего: при отказе хотя бы по одной позиции ответ 409 с причинами по позициям
+@router.post("/bulk", response_model=BulkTicketResult)
+def buy_tickets_bulk(order: BulkTicketRequest, response: Response, db: Session = Depends(get_db)):
+    success, lines = crud.purchase_tickets_bulk(db, order.user_id, order.items)
+    if not success:
+        response.status_code = 409
+    return {"success": success, "lines": lines}
 
 # 🔹 Получение всех билетов пользователя
 @router.get("/{user_id}", response_model=list[TicketOut])
 def get_tickets(user_id: int, db: Session = Depends(get_db)):
     print(f"📢 Получен запрос на билеты для user_id={user_id}")
-    tickets = db.query(Ticket).filter(Ticket.user_id == user_id).all()
+    if fastjson.ENABLED:
+        return fastjson.rows_response(crud.get_user_ticket_rows(db, user_id), crud.TICKET_FIELDS)
+    tickets = crud.get_user_tickets(db, user_id)
     print(f"🎟 Найдено билетов: {len(tickets)}")
     return tickets
 
+# 🔹 Билеты пользователя вместе с событиями — один запрос вместо запроса на каждый билет
+@router.get("/{user_id}/events", response_model=list[TicketWithEventOut])
+def get_tickets_with_events(user_id: int, db: Session = Depends(get_db)):
+    return crud.get_user_tickets(db, user_id, with_events=True)
+
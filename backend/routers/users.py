@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from backend.schemas import UserCreate, UserOut, UserLogin, Token
 from backend.models import User
 from backend.config import get_db
+from backend import crud, fastjson
 from datetime import timedelta
 import jwt
 
@@ -22,25 +23,25 @@ def create_access_token(data: dict):
     token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return token
 
-# 🔹 Регистрация пользователя (без хеширования пароля)
+# 🔹 Регистрация пользователя
 @router.post("/register", response_model=UserOut)
 def register_user(user: UserCreate, db: Session = Depends(get_db)):
     existing_user = db.query(User).filter(User.email == user.email).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email уже используется")
     
-    new_user = User(username=user.username, email=user.email, password=user.password)  # Просто сохраняем пароль без хеширования
+    new_user = User(username=user.username, email=user.email, password=crud.hash_password(user.password))
     
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
     return new_user
 
-# 🔹 Логин пользователя (простая проверка пароля без хеширования)
+# 🔹 Логин пользователя
 @router.post("/login", response_model=Token)
 def login_user(user: UserLogin, db: Session = Depends(get_db)):
     db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or db_user.password != user.password:  # Простое сравнение строк
+    if not db_user or not crud.check_user_password(db, db_user, user.password):
         raise HTTPException(status_code=401, detail="Неверный email или пароль")
     
     access_token = create_access_token({"sub": db_user.email})
@@ -49,5 +50,7 @@ def login_user(user: UserLogin, db: Session = Depends(get_db)):
 # 🔹 Получение списка пользователей (для теста)
 @router.get("/", response_model=list[UserOut])
 def get_users(db: Session = Depends(get_db)):
+    if fastjson.ENABLED:
+        return fastjson.rows_response(crud.get_user_rows(db), crud.USER_FIELDS)
     users = db.query(User).all()
     return users
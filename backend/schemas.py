@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 # 🔹 Вывод пользователя (без пароля)
 class UserOut(BaseModel):
@@ -50,11 +50,41 @@ class EventOut(BaseModel):
     class Config:
         from_attributes = True
 
+# 🔹 Страница ленты изменений каталога (/events/changes)
+class EventChangesOut(BaseModel):
+    since: int
+    version: int  # Курсор для следующего запроса
+    has_more: bool
+    upserted: list[dict]  # Текущее состояние созданных/изменённых событий
+    deleted: list[int]
+
 # 🔹 Создание билета
 class TicketCreate(BaseModel):
     user_id: int
     event_id: int
 
+# 🔹 Позиция групповой покупки: N билетов на одно событие
+class TicketOrderLine(BaseModel):
+    event_id: int
+    quantity: int = Field(1, ge=1, le=100)
+
+# 🔹 Групповая покупка (корзина из нескольких событий), всё или ничего
+class BulkTicketRequest(BaseModel):
+    user_id: int
+    items: list[TicketOrderLine] = Field(..., min_length=1, max_length=20)
+
+# 🔹 Результат по одному событию корзины
+class TicketLineResult(BaseModel):
+    event_id: int
+    quantity: int
+    status: str  # ok / not_found / sold_out / rolled_back
+    available_tickets: Optional[int] = None  # Остаток после покупки или при отказе
+    ticket_ids: list[int] = []
+
+class BulkTicketResult(BaseModel):
+    success: bool
+    lines: list[TicketLineResult]
+
 # 🔹 Отображение билета
 class TicketOut(BaseModel):
     id: int
@@ -65,6 +95,10 @@ class TicketOut(BaseModel):
     class Config:
         from_attributes = True
 
+# 🔹 Билет вместе с событием («мои билеты»)
+class TicketWithEventOut(TicketOut):
+    event: Optional[EventOut] = None
+
 # 🔹 Токен
 class Token(BaseModel):
     access_token: str
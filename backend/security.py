@@ -1,16 +1,23 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from .config import get_db
-from . import models, auth
-# Секретный ключ для шифрования токена
-SECRET_KEY = "your_secret_key"  # !!! Поменяй на случайный ключ
-ALGORITHM = "HS256"
+from .config import SECRET_KEY, ALGORITHM, SessionLocal
+from . import models
+
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Время жизни токена (30 минут)
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+# Сколько секунд расшифрованный токен и пользователь живут в кэше
+PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     """Создание JWT-токена"""
@@ -28,14 +35,100 @@ def verify_token(token: str):
     except JWTError:
         return None
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Проверка токена и извлечение пользователя"""
-    payload = auth.verify_token(token)  # Используем verify_token из auth.py
-    if not payload:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверный токен")
-
-    user = db.query(models.User).filter(models.User.email == payload["sub"]).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
-    
-    return user
\ No newline at end of file
+
+@dataclass(frozen=True)
+class Principal:
+    """Текущий пользователь без привязки к сессии БД (можно хранить в кэше)."""
+    id: int
+    username: str
+    email: str
+    is_admin: bool
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, username=user.username, email=user.email, is_admin=bool(user.is_admin))
+
+
+class PrincipalCache:
+    """Кэш «токен → пользователь» с TTL (не дольше срока жизни токена) и ограничением размера."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[float, Principal]]" = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.time():
+                self._drop(token)
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal: Principal, token_expires_at: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._drop(token)
+            self._entries[token] = (expires_at, principal)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Сбрасывает все закэшированные токены пользователя (после смены профиля или пароля)."""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._drop(token)
+
+    def _drop(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[1].id]
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL, PRINCIPAL_CACHE_MAX_ENTRIES)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Единая зависимость для защищённых эндпоинтов.
+
+    Повторные запросы с тем же токеном обслуживаются из кэша без расшифровки
+    JWT и без обращения к БД; сессия открывается только при промахе.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Не удалось подтвердить учетные данные",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    payload = verify_token(token)
+    if not payload or not payload.get("sub"):
+        raise credentials_exception
+
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == payload["sub"]).first()
+        if not user:
+            raise credentials_exception
+        principal = Principal.from_user(user)
+    finally:
+        db.close()
+
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
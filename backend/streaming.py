@@ -0,0 +1,120 @@
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlalchemy.orm import Session
+
+from backend import fastjson
+
+# 🔹 Потоковая выгрузка больших таблиц (NDJSON или CSV, по возможности gzip).
+# Строки читаются серверным курсором пачками по EXPORT_BATCH_SIZE (yield_per),
+# каждая пачка сразу кодируется и отправляется клиенту: память не зависит от
+# размера таблицы, первый байт уходит сразу после первой пачки.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _csv_value(value: Any):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _encode_ndjson(rows: Sequence[Sequence], fields: Sequence[str]) -> bytes:
+    return b"".join(fastjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+def _encode_csv(rows: Sequence[Sequence], fields: Sequence[str]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_csv_value(v) for v in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+def stream_rows(
+    session_factory: Callable[[], Session],
+    statement: Select,
+    fields: Sequence[str],
+    fmt: str = "ndjson",
+    compress: bool = True,
+) -> Iterator[bytes]:
+    """
+    Генератор тела ответа. Сессия открывается внутри генератора: зависимость
+    get_db закрывается раньше, чем StreamingResponse дочитает данные.
+    """
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    # wbits=31 — формат gzip (заголовок и контрольная сумма), а не «голый» deflate
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(chunk: bytes) -> Optional[bytes]:
+        if compressor is None:
+            return chunk
+        # Z_SYNC_FLUSH отдаёт сжатую пачку сразу, не дожидаясь заполнения буфера zlib
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    db = session_factory()
+    try:
+        if fmt == "csv":
+            header = emit(_encode_csv([fields], fields))
+            if header:
+                yield header
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            chunk = emit(encode(rows, fields))
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        db.close()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Принимает ли клиент gzip, с учётом q-значений: «gzip;q=0» — отказ,
+    «*» покрывает gzip, если он не указан явно.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def export_response(
+    request: Request,
+    session_factory: Callable[[], Session],
+    statement: Select,
+    fields: Sequence[str],
+    fmt: str,
+    name: str,
+) -> StreamingResponse:
+    """gzip включается, если клиент указал его в Accept-Encoding."""
+    compress = accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(
+        stream_rows(session_factory, statement, fields, fmt, compress),
+        media_type=FORMATS[fmt],
+        headers=headers,
+    )
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from backend import config, main, models
+from backend.querycount import QueryCounter, assert_max_queries
+
+# 🔹 Число SQL-запросов эндпоинтов со списками билетов не должно зависеть от
+# числа билетов (нет N+1). База — SQLite в памяти, приложение то же самое.
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    config.Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture()
+def session_factory(engine):
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@pytest.fixture()
+def client(session_factory):
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # /reservations использует get_db из backend.main, роутеры — из backend.config
+    main.app.dependency_overrides[main.get_db] = get_test_db
+    main.app.dependency_overrides[config.get_db] = get_test_db
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def create_user_with_tickets(session_factory, user_id: int, tickets: int):
+    db = session_factory()
+    db.add(models.User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com", password="x"))
+    start = datetime(2026, 1, 1)
+    for i in range(tickets):
+        event = models.Event(name=f"Event {user_id}-{i}", location="Almaty", date=start + timedelta(days=i),
+                             price=10, category="Concert", available_tickets=10, total_tickets=10)
+        db.add(event)
+        db.flush()
+        db.add(models.Ticket(user_id=user_id, event_id=event.id, purchase_date=start))
+    db.commit()
+    db.close()
+
+
+def count_queries(engine, client, path: str) -> int:
+    with QueryCounter(engine) as counter:
+        response = client.get(path)
+    assert response.status_code == 200, response.text
+    return counter.count
+
+
+@pytest.mark.parametrize("path", ["/reservations/{user_id}", "/tickets/{user_id}/events"])
+def test_query_count_does_not_grow_with_tickets(engine, session_factory, client, path):
+    create_user_with_tickets(session_factory, user_id=1, tickets=1)
+    create_user_with_tickets(session_factory, user_id=2, tickets=25)
+
+    single = count_queries(engine, client, path.format(user_id=1))
+    with assert_max_queries(engine, single):
+        response = client.get(path.format(user_id=2))
+    assert response.status_code == 200
+    assert len(response.json()) == 25
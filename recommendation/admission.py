@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue and a per-request deadline.
+
+    At most ``max_concurrent`` requests compute at once and at most ``max_queue``
+    wait for a slot. A request is served the degraded response instead when the
+    queue is full (shed), when it waited longer than ``queue_timeout`` or when
+    it has not finished ``deadline`` seconds after arriving.
+    """
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64,
+                 queue_timeout: float = 0.5, deadline: float = 2.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        # Created on first use so it binds to the server's event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.queue_timeouts = 0
+        self.deadline_exceeded = 0
+        self.degraded = 0
+
+    async def run(self, compute: Callable[[], Awaitable[T]], degraded: Callable[[], T]) -> T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+
+        started = time.monotonic()
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.shed += 1
+            return self._degrade(degraded, "queue full")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            return self._degrade(degraded, "queue timeout")
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        try:
+            remaining = max(self.deadline - (time.monotonic() - started), 0.0)
+            return await asyncio.wait_for(compute(), timeout=remaining)
+        except asyncio.TimeoutError:
+            self.deadline_exceeded += 1
+            return self._degrade(degraded, "deadline exceeded")
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def _degrade(self, degraded: Callable[[], T], reason: str) -> T:
+        self.degraded += 1
+        logger.warning(f"Serving degraded response: {reason}")
+        return degraded()
+
+    def stats(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queue_timeouts": self.queue_timeouts,
+            "deadline_exceeded": self.deadline_exceeded,
+            "degraded": self.degraded,
+        }
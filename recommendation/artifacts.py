@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+POINTER = "current.json"
+
+# Writes one artifact file into an open file object
+Writer = Callable[[Any], None]
+
+
+class ArtifactError(Exception):
+    """A version is missing, incomplete or fails checksum validation."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Versioned model artifacts on local disk.
+
+    Every publish writes all files of a model into a new directory under
+    ``versions/``, together with a manifest holding their sizes and SHA-256
+    checksums, renames the complete directory into place and only then
+    switches ``current.json`` to it. Readers follow the pointer, so they see
+    either the old or the new version, never a mix of files from both.
+    Switching versions (publish or rollback) is a single rename, independent
+    of the model size. The newest ``keep`` versions are retained for rollback.
+    """
+
+    def __init__(self, root: str, keep: int = 5):
+        self.root = root
+        self.keep = max(keep, 2)  # Current and at least one to roll back to
+        self.versions_dir = os.path.join(root, "versions")
+
+    def path(self, version: str, name: str) -> str:
+        return os.path.join(self.versions_dir, version, name)
+
+    # --- pointer ----------------------------------------------------------
+
+    def current_version(self) -> Optional[str]:
+        pointer = os.path.join(self.root, POINTER)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r") as f:
+            return json.load(f).get("version")
+
+    def _set_current(self, version: str):
+        pointer = os.path.join(self.root, POINTER)
+        tmp_path = f"{pointer}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": version, "activated_at": time.time()}, f)
+        os.replace(tmp_path, pointer)
+
+    # --- write ------------------------------------------------------------
+
+    def publish(self, files: Dict[str, Writer], modes: Dict[str, str], meta: Optional[Dict] = None) -> str:
+        """
+        Writes ``files`` (name -> writer, opened with ``modes[name]``) as a new
+        version and makes it current; returns the version.
+        """
+        version = time.strftime("%Y%m%d-%H%M%S") + f"-{uuid.uuid4().hex[:6]}"
+        version_dir = os.path.join(self.versions_dir, version)
+        tmp_dir = f"{version_dir}.tmp"
+        os.makedirs(tmp_dir)
+        try:
+            entries = {}
+            for name, write in files.items():
+                path = os.path.join(tmp_dir, name)
+                with open(path, modes.get(name, "wb")) as f:
+                    write(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                entries[name] = {"size": os.path.getsize(path), "sha256": _sha256(path)}
+            manifest = {"version": version, "created_at": time.time(), "files": entries, "meta": meta or {}}
+            with open(os.path.join(tmp_dir, MANIFEST), "w") as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self._set_current(version)
+        self._prune()
+        logger.info(f"Published model version {version}")
+        return version
+
+    def _prune(self):
+        current = self.current_version()
+        for manifest in self.versions()[self.keep:]:
+            if manifest["version"] != current:
+                shutil.rmtree(os.path.join(self.versions_dir, manifest["version"]), ignore_errors=True)
+
+    # --- read -------------------------------------------------------------
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.versions_dir):
+            return []
+        return [entry for entry in os.listdir(self.versions_dir) if not entry.endswith(".tmp")]
+
+    def has_version(self, version: str) -> bool:
+        return version in self._names()
+
+    def manifest(self, version: str) -> Dict:
+        # Only names listed in versions/ are accepted, so a caller-supplied
+        # version (rollback) can never point outside the store
+        if not self.has_version(version):
+            raise ArtifactError(f"Model version {version} does not exist")
+        return self._read_manifest(version)
+
+    def _read_manifest(self, version: str) -> Dict:
+        path = self.path(version, MANIFEST)
+        if not os.path.exists(path):
+            raise ArtifactError(f"Model version {version} is incomplete")
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def versions(self) -> List[Dict]:
+        """Manifests of the complete versions, newest first."""
+        manifests = []
+        for entry in self._names():
+            try:
+                manifests.append(self._read_manifest(entry))
+            except (ArtifactError, ValueError):
+                continue
+        return sorted(manifests, key=lambda m: m["created_at"], reverse=True)
+
+    def validate(self, version: str) -> Dict:
+        """The version's manifest, after checking that every file matches its size and checksum."""
+        manifest = self.manifest(version)
+        for name, entry in manifest["files"].items():
+            path = self.path(version, name)
+            if not os.path.exists(path):
+                raise ArtifactError(f"Model version {version}: {name} is missing")
+            if os.path.getsize(path) != entry["size"] or _sha256(path) != entry["sha256"]:
+                raise ArtifactError(f"Model version {version}: {name} fails checksum validation")
+        return manifest
+
+    # --- rollback ---------------------------------------------------------
+
+    def activate(self, version: str) -> Dict:
+        """Validates ``version`` and makes it current."""
+        manifest = self.validate(version)
+        self._set_current(version)
+        logger.info(f"Activated model version {version}")
+        return manifest
+
+    def rollback(self) -> Dict:
+        """Makes the version published before the current one current."""
+        current = self.current_version()
+        versions = [m["version"] for m in self.versions()]
+        if current not in versions:
+            raise ArtifactError("No current model version to roll back from")
+        older = versions[versions.index(current) + 1:]
+        if not older:
+            raise ArtifactError(f"No version older than {current} to roll back to")
+        return self.activate(older[0])
+
+    def stats(self) -> Dict:
+        return {
+            "current": self.current_version(),
+            "versions": [{"version": m["version"], "created_at": m["created_at"], "meta": m["meta"]}
+                         for m in self.versions()],
+        }
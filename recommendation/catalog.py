@@ -0,0 +1,166 @@
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d")
+
+
+def parse_price(value: Any) -> float:
+    """Prices come as ints from the backend and as strings like "Free" or "30" in fallback data."""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().lower()
+    if text in ("free", "бесплатно", ""):
+        return 0.0
+    try:
+        return float(text.replace(",", ".").rstrip("$₸ "))
+    except ValueError:
+        return math.nan
+
+
+def parse_date(value: Any) -> float:
+    """Event date as UTC epoch seconds (NaN when unknown)."""
+    if value is None:
+        return math.nan
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip()
+        try:
+            parsed = datetime.fromisoformat(text.replace("Z", "+00:00"))
+        except ValueError:
+            for fmt in DATE_FORMATS:
+                try:
+                    parsed = datetime.strptime(text, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return math.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+
+def _as_str(value: Any) -> Optional[str]:
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def response_row(event: Dict[str, Any]) -> Dict[str, Any]:
+    """An event dict in the exact shape (and coercions) of the EventResponse model."""
+    return {
+        "id": int(event["id"]),
+        "name": _as_str(event.get("name")),
+        "image": _as_str(event.get("image")),
+        "date": _as_str(event.get("date")),
+        "location": _as_str(event.get("location")),
+        "price": _as_str(event.get("price")),
+        "category": _as_str(event.get("category")),
+    }
+
+class CatalogSnapshot:
+    """
+    Immutable column view of the event catalog.
+
+    Events keep their original dicts (``events``) for responses; every column is
+    aligned with that list, so a row index selects the same event everywhere.
+    """
+
+    def __init__(self, events: List[Dict[str, Any]], popularity: Optional[Dict[int, float]] = None):
+        self.events = events
+        self.built_at = time.time()
+        n = len(events)
+
+        self.ids = np.fromiter((e["id"] for e in events), dtype=np.int64, count=n)
+        self.index = {int(event_id): i for i, event_id in enumerate(self.ids)}
+
+        self.categories: List[str] = sorted({e.get("category") or "" for e in events})
+        self.category_index = {category: code for code, category in enumerate(self.categories)}
+        self.category_codes = np.fromiter(
+            (self.category_index[e.get("category") or ""] for e in events), dtype=np.int32, count=n)
+
+        self.prices = np.fromiter((parse_price(e.get("price")) for e in events), dtype=np.float64, count=n)
+        self.dates = np.fromiter((parse_date(e.get("date")) for e in events), dtype=np.float64, count=n)
+
+        self.popularity = np.zeros(n, dtype=np.float64)
+        if popularity:
+            self.set_popularity(popularity)
+
+        # Filter structures: one mask per category, events ordered by date for
+        # range lookups (undated events sort last and never match a range)
+        self.category_masks = [self.category_codes == code for code in range(len(self.categories))]
+        self.date_order = np.argsort(self.dates, kind="stable")
+        self.sorted_dates = self.dates[self.date_order]
+        self.dated_count = int(np.count_nonzero(~np.isnan(self.dates)))
+
+    def __len__(self):
+        return len(self.events)
+
+    def set_popularity(self, popularity: Dict[int, float]):
+        column = np.zeros(len(self.events), dtype=np.float64)
+        for event_id, count in popularity.items():
+            i = self.index.get(event_id)
+            if i is not None:
+                column[i] = count
+        self.popularity = column
+
+    def rows(self, event_ids: Iterable[int]) -> np.ndarray:
+        """Row indices of the given event ids that are in the catalog."""
+        return np.fromiter((self.index[e] for e in event_ids if e in self.index), dtype=np.int64)
+
+    def seen_mask(self, event_ids: Iterable[int]) -> np.ndarray:
+        mask = np.zeros(len(self.events), dtype=bool)
+        mask[self.rows(event_ids)] = True
+        return mask
+
+    def affinity_vector(self, weights: Dict[str, float]) -> np.ndarray:
+        """Per-category-code weights aligned with ``categories``."""
+        vector = np.zeros(len(self.categories), dtype=np.float64)
+        for category, weight in weights.items():
+            code = self.category_index.get(category)
+            if code is not None:
+                vector[code] = weight
+        return vector
+
+    def category_mask(self, categories: Iterable[str]) -> np.ndarray:
+        mask = np.zeros(len(self.events), dtype=bool)
+        for category in categories:
+            code = self.category_index.get(category)
+            if code is not None:
+                mask |= self.category_masks[code]
+        return mask
+
+    def date_mask(self, start: Optional[float] = None, end: Optional[float] = None) -> np.ndarray:
+        """Events dated within ``[start, end]`` (epoch seconds, either side open)."""
+        dated = self.sorted_dates[:self.dated_count]
+        lo = 0 if start is None else int(np.searchsorted(dated, start, side="left"))
+        hi = self.dated_count if end is None else int(np.searchsorted(dated, end, side="right"))
+        mask = np.zeros(len(self.events), dtype=bool)
+        mask[self.date_order[lo:hi]] = True
+        return mask
+
+    def filter_mask(self, categories: Optional[Iterable[str]] = None, max_price: Optional[float] = None,
+                    date_from: Optional[float] = None, date_to: Optional[float] = None,
+                    exclude_past: bool = False, now: Optional[float] = None) -> np.ndarray:
+        """Boolean mask of events matching every given filter; no filters selects everything."""
+        mask = np.ones(len(self.events), dtype=bool)
+        if categories:
+            mask &= self.category_mask(categories)
+        if max_price is not None:
+            # Unknown prices are NaN and never match
+            mask &= self.prices <= max_price
+        if exclude_past:
+            now = time.time() if now is None else now
+            date_from = now if date_from is None else max(date_from, now)
+        if date_from is not None or date_to is not None:
+            mask &= self.date_mask(date_from, date_to)
+        return mask
+
+    def take(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.events[i] for i in rows]
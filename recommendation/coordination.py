@@ -0,0 +1,79 @@
+import fcntl
+import logging
+import os
+import zlib
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class TrainingLock:
+    """
+    Cross-process lock that elects one trainer among all workers.
+
+    With several workers (``uvicorn --workers N``, several containers) every
+    worker would otherwise train at startup and write the same model files.
+    ``hold(name)`` tries to take the lock without waiting and yields whether it
+    got it; the worker that did trains and publishes, the others skip and pick
+    the new model version up from disk.
+
+    ``backend="pg"`` uses a session-level Postgres advisory lock, which works
+    across hosts and is released by the server if the worker dies.
+    ``backend="file"`` uses ``flock`` on a file in ``lock_dir``, which covers
+    workers sharing one filesystem and is needed behind PgBouncer in
+    transaction mode, where session-level locks are not kept.
+    """
+
+    def __init__(self, engine: Engine, lock_dir: str, backend: str = "pg"):
+        self.engine = engine
+        self.lock_dir = lock_dir
+        self.backend = backend if engine.dialect.name == "postgresql" else "file"
+
+    @staticmethod
+    def _key(name: str) -> int:
+        return zlib.crc32(f"recommendation-training:{name}".encode())
+
+    @contextmanager
+    def hold(self, name: str) -> Iterator[bool]:
+        if self.backend == "pg":
+            with self._hold_advisory(name) as acquired:
+                yield acquired
+        else:
+            with self._hold_file(name) as acquired:
+                yield acquired
+
+    @contextmanager
+    def _hold_advisory(self, name: str) -> Iterator[bool]:
+        key = self._key(name)
+        # The lock belongs to this connection, so it stays checked out until released
+        with self.engine.connect() as conn:
+            acquired = bool(conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar())
+            conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                    conn.commit()
+
+    @contextmanager
+    def _hold_file(self, name: str) -> Iterator[bool]:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.lock_dir, f".{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
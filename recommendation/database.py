@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Single place where the service talks to Postgres: engine, pool and sessions.
+# Every pool setting can be overridden from the environment.
+
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:1234@db:5432/event_platform")
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # reopen connections older than this
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 disables the limit
+# Behind PgBouncer in transaction mode connections must not be held by the app
+# and startup parameters are rejected, so the statement timeout is applied with
+# SET LOCAL at the start of every transaction instead
+PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+
+class PoolMetrics:
+    """Time spent waiting for a pooled connection, and how often it was slow."""
+
+    SLOW_CHECKOUT = 0.1  # seconds
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+
+    def observe(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if waited >= self.SLOW_CHECKOUT:
+                self.slow_checkouts += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class _TimedPoolMixin:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            pool_metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.observe(time.perf_counter() - started)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(_TimedPoolMixin, NullPool):
+    pass
+
+
+def create_db_engine(url: str = DATABASE_URL):
+    if PGBOUNCER:
+        db_engine = create_engine(url, poolclass=TimedNullPool)
+        if STATEMENT_TIMEOUT_MS:
+            @event.listens_for(db_engine, "begin")
+            def set_statement_timeout(conn):
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+        return db_engine
+
+    connect_args = {}
+    if STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    return create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+# Creating the engine does not connect; the first checkout does
+engine = create_db_engine()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def wait_for_db(max_retries: int = 30, retry_interval: float = 2) -> bool:
+    """Block until the database accepts connections through the shared engine."""
+    retries = max_retries
+    while retries > 0:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            logger.info("✅ Connected to the database")
+            return True
+        except OperationalError as e:
+            logger.warning(f"⏳ Database connection failed ({e}). Retrying in {retry_interval} seconds... ({retries} retries left)")
+            time.sleep(retry_interval)
+            retries -= 1
+    logger.error("❌ Failed to connect to the database after multiple attempts")
+    return False
+
+
+def pool_status() -> dict:
+    """Pool occupancy and checkout wait statistics."""
+    status = {
+        "mode": "pgbouncer" if PGBOUNCER else "pool",
+        "checkouts": pool_metrics.checkouts,
+        "checkout_wait_avg_ms": round(pool_metrics.wait_total / pool_metrics.checkouts * 1000, 3)
+        if pool_metrics.checkouts else 0.0,
+        "checkout_wait_max_ms": round(pool_metrics.wait_max * 1000, 3),
+        "slow_checkouts": pool_metrics.slow_checkouts,
+        "checkout_timeouts": pool_metrics.timeouts,
+    }
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + MAX_OVERFLOW
+        status.update({
+            "size": pool.size(),
+            "max_overflow": MAX_OVERFLOW,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+        })
+    return status
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, Float, DateTime, JSON
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+
+Base = declarative_base()
+
+class EventClick(Base):
+    __tablename__ = "event_clicks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    event_id = Column(Integer, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    
+class EventView(Base):
+    __tablename__ = "event_views"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    event_id = Column(Integer, index=True)
+    view_duration = Column(Float, default=0.0)  # Time spent viewing in seconds
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+# Per-user feature row: time-decayed category affinity, updated on every click/view
+class UserProfile(Base):
+    __tablename__ = "user_profiles"
+    
+    user_id = Column(Integer, primary_key=True)
+    category_weights = Column(JSON, nullable=False, default=dict)  # {category: weight as of updated_at}
+    interaction_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Last activity
@@ -0,0 +1,26 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # same output through the stdlib encoder, only slower
+    orjson = None
+
+# Opt-in fast JSON encoding of list responses (FAST_JSON_RESPONSES=true):
+# rows that are already in the response shape are encoded directly instead of
+# being validated one by one through the response model.
+ENABLED = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+
+def _default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
@@ -0,0 +1,31 @@
+# Multi-worker serving with models shared between workers:
+#
+#     PRELOAD_MODELS=true gunicorn -c gunicorn.conf.py main:app
+#
+# The app (and with PRELOAD_MODELS the cached models) is imported once in the
+# master and the workers are forked from it, so read-only model data is shared
+# copy-on-write instead of being loaded by every worker. Training is still done
+# by a single worker at a time (TRAINING_LOCK_BACKEND, see coordination.py),
+# and snapshot exports are serialised with a lock file in INTERACTION_SNAPSHOT_DIR.
+#
+# Every worker keeps its own in-memory caches. The seen-events and profile
+# caches are re-read after SEEN_CACHE_TTL_SECONDS / PROFILE_CACHE_TTL_SECONDS,
+# so a click handled by another worker shows up within that time; the catalog
+# replica is revalidated against the backend every CATALOG_TTL_SECONDS.
+import os
+
+bind = "0.0.0.0:8080"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# Startup waits for the database and builds the catalog snapshot in the background
+timeout = 120
+
+
+def post_fork(server, worker):
+    # The preloaded app may have used the engine in the master (the training
+    # lock around the legacy model import). A pooled connection inherited by
+    # several workers would share one socket, so each worker starts with an
+    # empty pool; close=False leaves the master's connections to the master
+    import database
+    database.engine.dispose(close=False)
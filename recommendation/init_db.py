@@ -0,0 +1,24 @@
+import logging
+import sys
+
+import database
+from db_models import Base
+
+# Creates the service's tables in a separate process before the server starts:
+#     python init_db.py && uvicorn main:app
+# so that API workers never block on the database or run DDL while starting.
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    if not database.wait_for_db():
+        return 1
+    Base.metadata.create_all(bind=database.engine)
+    logger.info("✅ Tables created or verified")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,59 +1,149 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Table, MetaData, DateTime, func, desc
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
-from typing import List, Optional, Dict, Any
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+from typing import List, Literal, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import os
 import time
 import logging
+import asyncio
+import threading
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import gc
 import httpx
-import random
-from sqlalchemy.exc import OperationalError
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from contextlib import asynccontextmanager
+from dataclasses import replace
 import pickle
+import shutil
 import json
 from collections import defaultdict
+from fastapi import BackgroundTasks
+from db_models import EventClick, EventView
+import database
+from database import engine, SessionLocal
+from seen_cache import SeenCache
+from profiles import ProfileStore
+from catalog import CatalogSnapshot, response_row
+import fastjson
+import request_timing
+from request_timing import timed
+import streaming
+from snapshots import InteractionSnapshots
+import mf
+from strategies import RankRequest, ShadowRunner, StrategyRegistry
+from scoring import ScoringWeights, score, static_scores, top_k
+from admission import AdmissionController
+from coordination import TrainingLock
+from artifacts import ArtifactError, ArtifactStore
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:1234@db:5432/event_platform")
-
-# Create engine and session
-engine = None
-SessionLocal = None
-Base = declarative_base()
-
 # Path for storing ML models
 MODEL_DIR = "/app/models"
 os.makedirs(MODEL_DIR, exist_ok=True)
-USER_CLUSTER_MODEL_PATH = os.path.join(MODEL_DIR, "user_clusters.pkl")
-EVENT_CATEGORY_MATRIX_PATH = os.path.join(MODEL_DIR, "event_category_matrix.json")
+# K-Means model files, published together as one version of the artifact store
+# (see artifacts.py): a version is complete and checksummed before it becomes current
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "5"))
+cluster_store = ArtifactStore(os.path.join(MODEL_DIR, "clusters"), keep=MODEL_KEEP_VERSIONS)
+USER_CLUSTER_MODEL_FILE = "user_clusters.pkl"
+EVENT_CATEGORY_MATRIX_FILE = "event_category_matrix.json"
+# user_id -> cluster as plain JSON: serving reads this file, so loading a cached
+# model never has to unpickle (and import) scikit-learn
+USER_CLUSTER_MAP_FILE = "user_clusters.json"
 
-# Models
-class EventClick(Base):
-    __tablename__ = "event_clicks"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    event_id = Column(Integer, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    
-class EventView(Base):
-    __tablename__ = "event_views"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
-    event_id = Column(Integer, index=True)
-    view_duration = Column(Float, default=0.0)  # Time spent viewing in seconds
-    timestamp = Column(DateTime, default=datetime.utcnow)
+# Columnar copy of clicks/views on local disk, exported incrementally (see snapshots.py)
+snapshots = InteractionSnapshots(
+    os.getenv("INTERACTION_SNAPSHOT_DIR", "/app/data/snapshots"),
+    partition_rows=int(os.getenv("SNAPSHOT_PARTITION_ROWS", "1000000")),
+    lag_seconds=float(os.getenv("SNAPSHOT_LAG_SECONDS", "60")),
+)
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300"))  # 0 disables periodic export
+# "snapshot": train from the snapshot files (the database is used only while no
+# snapshot exists yet); "db": query event_clicks directly
+TRAINING_SOURCE = os.getenv("TRAINING_SOURCE", "snapshot")
+
+# Implicit-feedback matrix factorisation over clicks and views (see mf.py),
+# served by /recommendations?strategy=mf
+MF_DIR = os.path.join(MODEL_DIR, "mf")
+# Factor arrays are versioned in the same kind of store as the cluster model
+mf_store = ArtifactStore(MF_DIR, keep=MODEL_KEEP_VERSIONS)
+MF_WINDOW_DAYS = float(os.getenv("MF_WINDOW_DAYS", "90"))
+MF_CONFIG = mf.ALSConfig(
+    factors=int(os.getenv("MF_FACTORS", "32")),
+    regularization=float(os.getenv("MF_REGULARIZATION", "0.05")),
+    alpha=float(os.getenv("MF_ALPHA", "20")),
+    iterations=int(os.getenv("MF_ITERATIONS", "10")),
+    threads=int(os.getenv("MF_THREADS", str(os.cpu_count() or 1))),
+)
+mf_model: Optional[mf.MFModel] = None
+mf_latency = mf.LatencyStats()
+_mf_training_lock = threading.Lock()
+
+# Multi-worker deployments: one worker at a time trains and publishes a model
+# (see coordination.py); every worker polls MODEL_DIR and loads new versions
+training_lock = TrainingLock(
+    engine, MODEL_DIR,
+    backend=os.getenv("TRAINING_LOCK_BACKEND", "file" if database.PGBOUNCER else "pg"),
+)
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "30"))  # 0 disables polling
+# Load the cached models at import time. Under gunicorn with preload_app (see
+# gunicorn.conf.py) this happens once in the master before forking, and the
+# workers share the read-only model copy-on-write
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+
+# Recent interactions per user, used to avoid recommending already seen events
+SEEN_WINDOW_DAYS = 7
+seen_cache = SeenCache(
+    window_seconds=SEEN_WINDOW_DAYS * 24 * 3600,
+    max_users=int(os.getenv("SEEN_CACHE_MAX_USERS", "10000")),
+    max_events_per_user=int(os.getenv("SEEN_CACHE_MAX_EVENTS", "256")),
+    # Clicks handled by other workers become visible after this long
+    ttl_seconds=float(os.getenv("SEEN_CACHE_TTL_SECONDS", "60")),
+)
+
+# Time-decayed category affinity per user, updated on every click/view
+profile_store = ProfileStore(
+    half_life_days=float(os.getenv("PROFILE_HALF_LIFE_DAYS", "14")),
+    max_users=int(os.getenv("PROFILE_CACHE_MAX_USERS", "10000")),
+    # Updates made by other workers become visible after this long
+    ttl_seconds=float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60")),
+)
+CLICK_WEIGHT = 1.0
+VIEW_WEIGHT = 0.5
+VIEW_FULL_DURATION = 30.0  # Views this long (seconds) or longer get the full view weight
+
+# event_id -> category, refreshed whenever the catalog is fetched
+event_categories: Dict[int, str] = {}
+
+# Catalog snapshot and ranking parameters
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "30"))
+catalog_snapshot: Optional[CatalogSnapshot] = None
+SCORING_WEIGHTS = ScoringWeights(
+    affinity=float(os.getenv("SCORE_AFFINITY_WEIGHT", "1.0")),
+    trending=float(os.getenv("SCORE_TRENDING_WEIGHT", "0.5")),
+    recency=float(os.getenv("SCORE_RECENCY_WEIGHT", "0.2")),
+    noise=float(os.getenv("SCORE_NOISE_WEIGHT", "0.05")),
+)
+# Cap on events per category in one response (0 disables diversification)
+MAX_PER_CATEGORY = int(os.getenv("RECOMMENDATION_MAX_PER_CATEGORY", "0")) or None
+
+# Overload protection for /recommendations: requests beyond the limit, or
+# past their deadline, get the precomputed trending list instead
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("RECOMMENDATION_MAX_CONCURRENT", "16")),
+    max_queue=int(os.getenv("RECOMMENDATION_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("RECOMMENDATION_QUEUE_TIMEOUT", "0.5")),
+    deadline=float(os.getenv("RECOMMENDATION_DEADLINE", "2.0")),
+)
+DEGRADED_LIST_SIZE = 20  # Matches the maximum `limit` of /recommendations
+degraded_recommendations: List[Dict[str, Any]] = []
 
 # Pydantic models
 class ClickCreate(BaseModel):
@@ -81,30 +171,6 @@ class EventResponse(BaseModel):
     class Config:
         orm_mode = True
 
-# Connect to DB with retries
-def connect_to_db_with_retries(max_retries=30, retry_interval=2):
-    global engine, SessionLocal, Base
-    
-    retries = max_retries
-    while retries > 0:
-        try:
-            engine = create_engine(DATABASE_URL)
-            with engine.connect() as conn:
-                logger.info("✅ Connected to the database")
-                SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-                
-                # Create tables if they don't exist
-                Base.metadata.create_all(bind=engine)
-                logger.info("✅ Tables created or verified")
-                return True
-        except OperationalError as e:
-            logger.warning(f"⏳ Database connection failed ({e}). Retrying in {retry_interval} seconds... ({retries} retries left)")
-            time.sleep(retry_interval)
-            retries -= 1
-    
-    logger.error("❌ Failed to connect to the database after multiple attempts")
-    return False
-
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -113,7 +179,30 @@ def get_db():
     finally:
         db.close()
 
-app = FastAPI(title="Event Recommendation Service")
+# Startup progress reported by /ready
+startup_state: Dict[str, Any] = {
+    "started_at": time.time(),
+    "database": False,
+    "model": False,
+    "catalog": False,
+    "ready_at": None,
+}
+
+# Startup only schedules the warm-up: the server accepts connections (and
+# answers /live) immediately, and /ready flips once the warm-up finishes.
+# Tables are created beforehand by init_db.py.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warm_up_task = asyncio.create_task(warm_up())
+    yield
+    warm_up_task.cancel()
+    engine.dispose()
+
+app = FastAPI(title="Event Recommendation Service", lifespan=lifespan)
+
+# Server-Timing headers, slow request log and sampled profiling (see request_timing.py)
+request_timing.install_db_listeners(engine)
+app.add_middleware(request_timing.RequestTimingMiddleware)
 
 # CORS configuration
 app.add_middleware(
@@ -129,12 +218,41 @@ app.add_middleware(
 def health_check():
     return {"status": "healthy", "service": "recommendation"}
 
+# Liveness probe: the process is up and serving requests
+@app.get("/live")
+def live():
+    return {"status": "alive"}
+
+# Readiness probe: database reachable, cached model (if any) and catalog snapshot loaded
+@app.get("/ready")
+def ready(response: Response):
+    state = dict(startup_state)
+    if state["ready_at"] is None:
+        response.status_code = 503
+        return {"status": "starting", **state}
+    return {"status": "ready", "startup_seconds": round(state["ready_at"] - state["started_at"], 3), **state}
+
+# Counters of the service's caches and overload protection
+@app.get("/metrics")
+def metrics():
+    return {
+        "admission": admission.stats(),
+        "seen_cache": seen_cache.stats(),
+        "profile_store": profile_store.stats(),
+        "db_pool": database.pool_status(),
+        "mf": {
+            "version": mf_model.meta.get("version") if mf_model else None,
+            "serving": mf_latency.stats(),
+        },
+    }
+
 # ML status endpoint
 @app.get("/ml/status")
 def ml_status(db: Session = Depends(get_db)):
     # Check if model exists
-    model_exists = os.path.exists(USER_CLUSTER_MODEL_PATH)
-    prefs_exists = os.path.exists(EVENT_CATEGORY_MATRIX_PATH)
+    cluster_model = _cluster_model
+    model_exists = cluster_model is not None
+    prefs_exists = model_exists
     
     # Get model stats if exists
     model_stats = {}
@@ -142,10 +260,7 @@ def ml_status(db: Session = Depends(get_db)):
     
     if model_exists:
         try:
-            with open(USER_CLUSTER_MODEL_PATH, 'rb') as f:
-                model_data = pickle.load(f)
-                
-            user_clusters = model_data.get('user_clusters', {})
+            _, user_clusters, cluster_preferences = cluster_model
             
             # Count users per cluster
             cluster_counts = defaultdict(int)
@@ -166,10 +281,7 @@ def ml_status(db: Session = Depends(get_db)):
     
     if prefs_exists:
         try:
-            with open(EVENT_CATEGORY_MATRIX_PATH, 'r') as f:
-                cluster_preferences = json.load(f)
-            
-            # Convert string keys to integers and get top categories per cluster
+            # Top categories per cluster
             for cluster_id, preferences in cluster_preferences.items():
                 top_categories = sorted(preferences.items(), key=lambda x: x[1], reverse=True)[:3]
                 cluster_stats[cluster_id] = {
@@ -207,12 +319,19 @@ def ml_status(db: Session = Depends(get_db)):
         "model_stats": model_stats,
         "cluster_stats": cluster_stats,
         "interaction_stats": click_stats,
-        "last_updated": os.path.getmtime(USER_CLUSTER_MODEL_PATH) if model_exists else None
+        "seen_cache": seen_cache.stats(),
+        "profile_store": profile_store.stats(),
+        "snapshots": snapshots.stats(),
+        "training_source": TRAINING_SOURCE,
+        "mf_model": mf_model.meta if mf_model else None,
+        "model_version": cluster_model[0] if model_exists else None,
+        "last_updated": next((m["created_at"] for m in cluster_store.versions()
+                              if model_exists and m["version"] == cluster_model[0]), None)
     }
 
 # Track event click
 @app.post("/click")
-def record_click(click: ClickCreate, db: Session = Depends(get_db)):
+def record_click(click: ClickCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     db_click = EventClick(
         user_id=click.user_id,
         event_id=click.event_id,
@@ -220,11 +339,15 @@ def record_click(click: ClickCreate, db: Session = Depends(get_db)):
     db.add(db_click)
     db.commit()
     db.refresh(db_click)
+    seen_cache.record(db_click.user_id, db_click.event_id, db_click.timestamp)
+    if db_click.user_id is not None:
+        background_tasks.add_task(update_user_profile, db_click.user_id, db_click.event_id,
+                                  CLICK_WEIGHT, db_click.timestamp)
     return {"status": "success", "message": "Click recorded"}
 
 # Track event view
 @app.post("/view")
-def record_view(view: ViewCreate, db: Session = Depends(get_db)):
+def record_view(view: ViewCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     db_view = EventView(
         user_id=view.user_id,
         event_id=view.event_id,
@@ -233,15 +356,98 @@ def record_view(view: ViewCreate, db: Session = Depends(get_db)):
     db.add(db_view)
     db.commit()
     db.refresh(db_view)
+    if db_view.user_id is not None:
+        weight = VIEW_WEIGHT * min(max(db_view.view_duration, 0.0) / VIEW_FULL_DURATION, 1.0)
+        if weight > 0:
+            background_tasks.add_task(update_user_profile, db_view.user_id, db_view.event_id,
+                                      weight, db_view.timestamp)
     return {"status": "success", "message": "View recorded"}
 
-# Fetch events from main backend
+# Streaming export of interactions for analytics and offline training, in id
+# order; after_id fetches only rows added since a previous export
+CLICK_EXPORT_FIELDS = ("id", "user_id", "event_id", "timestamp")
+VIEW_EXPORT_FIELDS = ("id", "user_id", "event_id", "view_duration", "timestamp")
+
+def export_table(request: Request, model, fields, fmt: str, name: str, after_id: Optional[int]):
+    statement = select(*[getattr(model, f) for f in fields]).order_by(model.id)
+    if after_id is not None:
+        statement = statement.where(model.id > after_id)
+    return streaming.export_response(request, SessionLocal, statement, fields, fmt, name)
+
+@app.get("/export/clicks")
+def export_clicks(request: Request, format: Literal["ndjson", "csv"] = Query("ndjson"),
+                  after_id: Optional[int] = None):
+    return export_table(request, EventClick, CLICK_EXPORT_FIELDS, format, "clicks", after_id)
+
+@app.get("/export/views")
+def export_views(request: Request, format: Literal["ndjson", "csv"] = Query("ndjson"),
+                 after_id: Optional[int] = None):
+    return export_table(request, EventView, VIEW_EXPORT_FIELDS, format, "views", after_id)
+
+# Remember event categories from a catalog fetch for profile updates
+def index_event_categories(events: List[Dict[str, Any]]):
+    for event in events:
+        if event.get('category'):
+            event_categories[event['id']] = event['category']
+
+# Fold one interaction into the user's category profile (runs after the response is sent)
+# An unknown event triggers a catalog refresh at most once per this interval, so
+# events that never get a category do not cause a download on every click
+CATEGORY_REFRESH_SECONDS = float(os.getenv("CATEGORY_REFRESH_SECONDS", "30"))
+_category_refresh = {"at": 0.0}
+
+async def update_user_profile(user_id: int, event_id: int, weight: float, timestamp: datetime):
+    if event_id not in event_categories and time.time() - _category_refresh["at"] >= CATEGORY_REFRESH_SECONDS:
+        _category_refresh["at"] = time.time()
+        index_event_categories(await fetch_events_from_backend())
+    category = event_categories.get(event_id)
+    if category is None:
+        logger.warning(f"Unknown category for event {event_id}, profile of user {user_id} not updated")
+        return
+    # The row lock and commit are blocking, so they run in a worker thread
+    await asyncio.to_thread(_record_profile, user_id, category, weight, timestamp)
+
+def _record_profile(user_id: int, category: str, weight: float, timestamp: datetime):
+    db = SessionLocal()
+    try:
+        profile_store.record(db, user_id, category, weight, timestamp)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating profile of user {user_id}: {e}")
+    finally:
+        db.close()
+
+# Fetch events from main backend. The service keeps a local replica of the
+# catalog: after one full download it only pulls deltas from the backend's
+# change feed, and a full download is revalidated with its ETag
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
+BACKEND_EVENT_FIELDS = "id,name,date,location,price,category"
+_backend_catalog: Dict[str, Any] = {"etag": None, "change_version": None, "events": {}}
+
 async def fetch_events_from_backend():
     try:
         async with httpx.AsyncClient() as client:
-            response = await client.get("http://backend:8000/events/")
+            if _backend_catalog["change_version"] is not None:
+                events = await _sync_catalog_changes(client)
+                if events is not None:
+                    return events
+            
+            headers = {}
+            if _backend_catalog["etag"]:
+                headers["If-None-Match"] = _backend_catalog["etag"]
+            # Only the columns the recommendation responses use
+            with timed("upstream"):
+                response = await client.get(f"{BACKEND_URL}/events/",
+                                            params={"fields": BACKEND_EVENT_FIELDS}, headers=headers)
+            if response.status_code == 304:
+                return list(_backend_catalog["events"].values())
             if response.status_code == 200:
-                return response.json()
+                events = response.json()
+                change_version = response.headers.get("x-change-version")
+                _backend_catalog["etag"] = response.headers.get("etag")
+                _backend_catalog["change_version"] = int(change_version) if change_version else None
+                _backend_catalog["events"] = {event['id']: event for event in events}
+                return events
             else:
                 logger.error(f"Failed to fetch events: {response.status_code}")
                 return []
@@ -249,6 +455,40 @@ async def fetch_events_from_backend():
         logger.error(f"Error fetching events: {e}")
         return []
 
+# Apply the backend's change feed to the local catalog replica; None means a
+# full download is needed
+async def _sync_catalog_changes(client: httpx.AsyncClient) -> Optional[List[Dict[str, Any]]]:
+    events = dict(_backend_catalog["events"])
+    version = _backend_catalog["change_version"]
+    has_more = True
+    while has_more:
+        with timed("upstream"):
+            response = await client.get(f"{BACKEND_URL}/events/changes",
+                                        params={"since": version, "fields": BACKEND_EVENT_FIELDS})
+        if response.status_code != 200:
+            logger.warning(f"Change feed unavailable ({response.status_code}), downloading full catalog")
+            return None
+        page = response.json()
+        for event in page["upserted"]:
+            events[event['id']] = event
+        for event_id in page["deleted"]:
+            events.pop(event_id, None)
+        version, has_more = page["version"], page["has_more"]
+    
+    _backend_catalog["events"] = events
+    _backend_catalog["change_version"] = version
+    return list(events.values())
+
+# Get user's recent clicks (oldest first), hydrating the seen cache from the DB on a miss
+def get_recent_clicks(db: Session, user_id: int) -> List[int]:
+    def load(since: datetime):
+        return db.query(EventClick.event_id, EventClick.timestamp).filter(
+            EventClick.user_id == user_id,
+            EventClick.timestamp > since
+        ).order_by(EventClick.timestamp).all()
+
+    return seen_cache.get(user_id, load)
+
 # Get static example events as fallback
 def get_fallback_events():
     return [
@@ -339,18 +579,113 @@ def create_user_event_matrix(db: Session):
         logger.error(f"Error creating user-event matrix: {e}")
         return None, None, None
 
+# ML: The same matrix built from the click snapshot, without touching Postgres
+def create_user_event_matrix_from_snapshot():
+    clicks = snapshots.load("clicks", ("user_id", "event_id"), since=time.time() - 30 * 24 * 3600)
+    known = clicks["user_id"] >= 0  # Exclude anonymous clicks
+    users, events = clicks["user_id"][known], clicks["event_id"][known]
+    if users.size == 0:
+        logger.warning("Not enough data to create user-event matrix")
+        return None, None, None
+    
+    # Count clicks per (user, event) cell
+    user_ids, user_rows = np.unique(users, return_inverse=True)
+    event_ids, event_cols = np.unique(events, return_inverse=True)
+    user_features = np.zeros((len(user_ids), len(event_ids)), dtype=np.int64)
+    np.add.at(user_features, (user_rows, event_cols), 1)
+    return user_features, user_ids.tolist(), event_ids.tolist()
+
+def load_training_matrix(db: Session):
+    if TRAINING_SOURCE == "snapshot" and snapshots.has_data("clicks"):
+        logger.info("Loading training data from the interaction snapshot")
+        return create_user_event_matrix_from_snapshot()
+    return create_user_event_matrix(db)
+
+# MF: (user, event, weight) triples of the last MF_WINDOW_DAYS, clicks and views
+# weighted as in the user profiles; from the snapshot when available
+def load_mf_interactions(db: Session):
+    since = datetime.utcnow() - timedelta(days=MF_WINDOW_DAYS)
+    if TRAINING_SOURCE == "snapshot" and snapshots.has_data("clicks"):
+        since_epoch = time.time() - MF_WINDOW_DAYS * 24 * 3600
+        clicks = snapshots.load("clicks", ("user_id", "event_id"), since=since_epoch)
+        views = snapshots.load("views", ("user_id", "event_id", "view_duration"), since=since_epoch)
+        click_users, click_events = clicks["user_id"], clicks["event_id"]
+        view_users, view_events, durations = views["user_id"], views["event_id"], views["view_duration"]
+    else:
+        click_rows = np.array(db.query(EventClick.user_id, EventClick.event_id).filter(
+            EventClick.timestamp > since, EventClick.user_id != None).all(), dtype=np.int64).reshape(-1, 2)
+        view_rows = db.query(EventView.user_id, EventView.event_id, EventView.view_duration).filter(
+            EventView.timestamp > since, EventView.user_id != None).all()
+        click_users, click_events = click_rows[:, 0], click_rows[:, 1]
+        view_users = np.array([r[0] for r in view_rows], dtype=np.int64)
+        view_events = np.array([r[1] for r in view_rows], dtype=np.int64)
+        durations = np.array([r[2] or 0.0 for r in view_rows], dtype=np.float64)
+    
+    view_weights = VIEW_WEIGHT * np.clip(durations / VIEW_FULL_DURATION, 0.0, 1.0)
+    users = np.concatenate([click_users, view_users])
+    events = np.concatenate([click_events, view_events])
+    weights = np.concatenate([np.full(len(click_users), CLICK_WEIGHT), view_weights])
+    keep = (users >= 0) & (weights > 0)
+    return users[keep], events[keep], weights[keep]
+
+# MF: Train, persist and swap in a new model; returns its metadata
+def train_mf(db: Session) -> Optional[Dict[str, Any]]:
+    if not _mf_training_lock.acquire(blocking=False):
+        logger.info("MF training already in progress, skipping")
+        return None
+    try:
+        with training_lock.hold("mf") as leader:
+            if not leader:
+                logger.info("Another worker is training the MF model, skipping")
+                return None
+            return _train_mf(db)
+    finally:
+        _mf_training_lock.release()
+
+def _train_mf(db: Session) -> Optional[Dict[str, Any]]:
+    global mf_model
+    users, events, weights = load_mf_interactions(db)
+    if users.size == 0:
+        logger.warning("Not enough interactions to train the MF model")
+        return None
+    model = mf.fit(users, events, weights, MF_CONFIG)
+    model.publish(mf_store)
+    mf_model = model
+    return model.meta
+
+# Only one training run at a time (startup, /train and background retraining
+# share it); across workers training_lock elects the one that trains
+_training_lock = threading.Lock()
+
 # ML: Train K-Means clustering model
 def train_user_clusters(db: Session):
+    if not _training_lock.acquire(blocking=False):
+        logger.info("Training already in progress, skipping")
+        return None
+    try:
+        with training_lock.hold("user_clusters") as leader:
+            if not leader:
+                logger.info("Another worker is training the cluster model, skipping")
+                return None
+            return _train_user_clusters(db)
+    finally:
+        _training_lock.release()
+
+def _train_user_clusters(db: Session):
     logger.info("Training user clusters model with K-Means...")
     
     # Create user-event interaction matrix
-    user_features, user_ids, event_ids = create_user_event_matrix(db)
+    user_features, user_ids, event_ids = load_training_matrix(db)
     
     if user_features is None or len(user_features) < 5:
         logger.warning("Not enough user data to train cluster model")
         return None
     
     try:
+        # scikit-learn takes seconds to import, so it is only loaded when training
+        from sklearn.cluster import KMeans
+        from sklearn.preprocessing import StandardScaler
+        
         # Normalize the features
         scaler = StandardScaler()
         scaled_features = scaler.fit_transform(user_features)
@@ -365,28 +700,20 @@ def train_user_clusters(db: Session):
         # Create a mapping from user_id to cluster
         user_clusters = {user_id: int(label) for user_id, label in zip(user_ids, cluster_labels)}
         
-        # Create a mapping of clusters to most clicked event categories
-        all_events = get_fallback_events() # Fallback if backend fails
-        
-        # Try to get events from backend
-        backend_events = asyncio.run(fetch_events_from_backend())
-        if backend_events:
-            all_events = backend_events
-        
-        # Create a mapping of event_id to category
-        event_categories = {}
-        for event in all_events:
-            event_categories[event['id']] = event['category']
+        # Event categories as indexed from the last catalog fetch (fallback events if none yet)
+        categories_by_event = dict(event_categories) or {
+            event['id']: event['category'] for event in get_fallback_events()
+        }
         
-        # For each cluster, find the most common event categories
+        # For each cluster, sum the clicks per event category
         cluster_preferences = defaultdict(lambda: defaultdict(int))
         
         for i, user_id in enumerate(user_ids):
             cluster = int(cluster_labels[i])
-            for event_id, count in user_event_matrix[user_id].items():
-                if event_id in event_categories:
-                    category = event_categories[event_id]
-                    cluster_preferences[cluster][category] += count
+            for j, event_id in enumerate(event_ids):
+                count = int(user_features[i][j])
+                if count and event_id in categories_by_event:
+                    cluster_preferences[cluster][categories_by_event[event_id]] += count
         
         # Save model and cluster preferences
         model_data = {
@@ -395,87 +722,308 @@ def train_user_clusters(db: Session):
             'user_clusters': user_clusters
         }
         
-        with open(USER_CLUSTER_MODEL_PATH, 'wb') as f:
-            pickle.dump(model_data, f)
-        
-        # Save cluster category preferences
-        with open(EVENT_CATEGORY_MATRIX_PATH, 'w') as f:
-            json.dump(dict(cluster_preferences), f)
+        # All three files are published as one version, then served by this worker
+        # right away (other workers pick it up from the store)
+        version = cluster_store.publish(
+            {
+                USER_CLUSTER_MODEL_FILE: lambda f: pickle.dump(model_data, f),
+                USER_CLUSTER_MAP_FILE: lambda f: json.dump(user_clusters, f),
+                EVENT_CATEGORY_MATRIX_FILE: lambda f: json.dump({k: dict(v) for k, v in cluster_preferences.items()}, f),
+            },
+            modes={USER_CLUSTER_MODEL_FILE: 'wb', USER_CLUSTER_MAP_FILE: 'w', EVENT_CATEGORY_MATRIX_FILE: 'w'},
+            meta={"clusters": n_clusters, "users": len(user_clusters)},
+        )
+        load_cached_model()
         
-        logger.info(f"✅ K-Means model trained with {n_clusters} clusters")
+        logger.info(f"✅ K-Means model trained with {n_clusters} clusters (version {version})")
         return user_clusters
     except Exception as e:
         logger.error(f"Error training K-Means model: {e}")
         return None
 
+# ML: The serving cluster model as (version, user -> cluster, cluster -> category
+# weights). Replaced as a whole, so a request never mixes two versions
+_cluster_model: Optional[tuple] = None
+
+def _read_user_clusters(path: str):
+    with open(path, 'r') as f:
+        # JSON keys are strings
+        return {int(k): v for k, v in json.load(f).items()}
+
+def _read_cluster_preferences(path: str):
+    with open(path, 'r') as f:
+        # Convert string keys to integers
+        return {int(k): v for k, v in json.load(f).items()}
+
 # ML: Get user's cluster
 def get_user_cluster(user_id: int):
-    if not os.path.exists(USER_CLUSTER_MODEL_PATH):
-        return None
-    
-    try:
-        with open(USER_CLUSTER_MODEL_PATH, 'rb') as f:
-            model_data = pickle.load(f)
-        
-        user_clusters = model_data.get('user_clusters', {})
-        return user_clusters.get(user_id)
-    except Exception as e:
-        logger.error(f"Error getting user cluster: {e}")
-        return None
+    cluster_model = _cluster_model
+    return cluster_model[1].get(user_id) if cluster_model else None
+
+# ML: Get category weights (click counts) for a cluster
+def get_cluster_weights(cluster_id: int) -> Dict[str, float]:
+    cluster_model = _cluster_model
+    return cluster_model[2].get(cluster_id, {}) if cluster_model else {}
 
 # ML: Get category preferences for a cluster
 def get_cluster_preferences(cluster_id: int):
-    if not os.path.exists(EVENT_CATEGORY_MATRIX_PATH):
+    preferences = get_cluster_weights(cluster_id)
+    
+    # Sort by count
+    sorted_preferences = sorted(preferences.items(), key=lambda x: x[1], reverse=True)
+    return [category for category, _ in sorted_preferences]
+
+# Model files written by versions before the artifact store: the cluster
+# files directly in MODEL_DIR, the MF factors in MF_DIR/<version>/ behind
+# MF_DIR/current.json (the pointer the store now uses as well)
+def _legacy_cluster_files() -> Optional[Dict[str, str]]:
+    legacy = {name: os.path.join(MODEL_DIR, name)
+              for name in (USER_CLUSTER_MODEL_FILE, USER_CLUSTER_MAP_FILE, EVENT_CATEGORY_MATRIX_FILE)}
+    if cluster_store.current_version() is not None or not all(map(os.path.exists, legacy.values())):
+        return None
+    return legacy
+
+def _legacy_mf_dir() -> Optional[str]:
+    version = mf_store.current_version()
+    if version is None or mf_store.has_version(version):
         return None
+    version_dir = os.path.join(MF_DIR, os.path.basename(version))
+    return version_dir if os.path.exists(os.path.join(version_dir, "meta.json")) else None
+
+# Every worker calls this on every model poll, so the import itself runs under
+# the training lock and re-checks once it holds it: only one worker imports
+def _import_legacy_models():
+    if _legacy_cluster_files() is None and _legacy_mf_dir() is None:
+        return
+    with training_lock.hold("legacy_import") as leader:
+        if not leader:
+            return
+        legacy = _legacy_cluster_files()
+        if legacy is not None:
+            def copy(path):
+                def write(f):
+                    with open(path, 'rb') as src:
+                        shutil.copyfileobj(src, f)
+                return write
+            
+            version = cluster_store.publish({name: copy(path) for name, path in legacy.items()}, modes={},
+                                            meta={"imported_from": MODEL_DIR})
+            logger.info(f"Imported the model files from {MODEL_DIR} as version {version}")
+        
+        version_dir = _legacy_mf_dir()
+        if version_dir is not None:
+            version = mf.MFModel.load_legacy(version_dir).publish(mf_store)
+            logger.info(f"Imported the MF model from {version_dir} as version {version}")
+
+# Serve the store's current version (validated against its checksums first);
+# False if there is no usable model. A version failing validation is not
+# served: the model already in memory, if any, stays in place
+def load_cached_model() -> bool:
+    global _cluster_model
+    try:
+        version = cluster_store.current_version()
+        if version is None:
+            return _cluster_model is not None
+        if _cluster_model is None or _cluster_model[0] != version:
+            cluster_store.validate(version)
+            _cluster_model = (
+                version,
+                _read_user_clusters(cluster_store.path(version, USER_CLUSTER_MAP_FILE)),
+                _read_cluster_preferences(cluster_store.path(version, EVENT_CATEGORY_MATRIX_FILE)),
+            )
+            logger.info(f"Loaded cluster model version {version}")
+    except (ArtifactError, OSError, ValueError) as e:
+        logger.error(f"Error loading cached model: {e}")
+    return _cluster_model is not None
+
+# Pick up model versions published (or rolled back) by any worker: a model is
+# reloaded when its store's current.json points to another version
+def refresh_models():
+    global mf_model
+    _import_legacy_models()
+    startup_state["model"] = load_cached_model()
+    version = mf_store.current_version()
+    if version is not None and (mf_model is None or mf_model.meta.get("version") != version):
+        try:
+            mf_model = mf.MFModel.load(mf_store, version)
+            logger.info(f"Loaded MF model version {version}")
+        except (ArtifactError, OSError, ValueError) as e:
+            logger.error(f"Error loading MF model version {version}: {e}")
+
+def start_model_watcher(interval: float = MODEL_POLL_SECONDS) -> threading.Event:
+    stop = threading.Event()
     
+    def loop():
+        while not stop.wait(interval):
+            try:
+                refresh_models()
+            except Exception as e:
+                logger.error(f"Error refreshing models: {e}")
+    
+    if interval > 0:
+        threading.Thread(target=loop, name="model-watcher", daemon=True).start()
+    return stop
+
+# Runs once at import time (in the gunicorn master when preloading). Freezing
+# the GC afterwards keeps collections in the workers from writing to the
+# preloaded objects' pages, which would undo the copy-on-write sharing
+def preload_models():
     try:
-        with open(EVENT_CATEGORY_MATRIX_PATH, 'r') as f:
-            cluster_preferences = json.load(f)
-        
-        # Convert string keys to integers
-        cluster_preferences = {int(k): v for k, v in cluster_preferences.items()}
-        
-        # Get preferences for this cluster
-        preferences = cluster_preferences.get(cluster_id, {})
-        
-        # Sort by count
-        sorted_preferences = sorted(preferences.items(), key=lambda x: x[1], reverse=True)
-        return [category for category, _ in sorted_preferences]
+        refresh_models()
     except Exception as e:
-        logger.error(f"Error getting cluster preferences: {e}")
-        return None
+        logger.error(f"Error preloading models: {e}")
+    gc.freeze()
 
-# Schedule periodic training of the model
-@app.on_event("startup")
-async def startup_event():
-    success = connect_to_db_with_retries()
-    if not success:
-        logger.error("Failed to connect to database. Exiting...")
-        exit(1)
+# Periodic incremental export of new interactions into the snapshot
+def start_snapshot_exporter(interval: float = SNAPSHOT_INTERVAL_SECONDS) -> threading.Event:
+    stop = threading.Event()
     
-    # Train model on startup if enough data
+    def loop():
+        while not stop.wait(interval):
+            db = SessionLocal()
+            try:
+                snapshots.export_all(db)
+            except Exception as e:
+                logger.error(f"Snapshot export failed: {e}")
+            finally:
+                db.close()
+    
+    if interval > 0:
+        threading.Thread(target=loop, name="snapshot-exporter", daemon=True).start()
+    return stop
+
+def train_in_background():
     db = SessionLocal()
     try:
-        train_user_clusters(db)
+        if train_user_clusters(db):
+            startup_state["model"] = True
     finally:
         db.close()
 
+# Startup warm-up: wait for the database, load the cached model and build the
+# catalog snapshot, then report ready. Training only runs here when there is
+# no cached model, and it runs in a thread after the service is already ready
+# (recommendations fall back to user profiles until it finishes).
+async def warm_up():
+    if not await asyncio.to_thread(database.wait_for_db):
+        logger.error("Failed to connect to database, service stays not ready")
+        return
+    startup_state["database"] = True
+    start_snapshot_exporter()
+    
+    # Cheap when the models were preloaded: unchanged files are not read again
+    try:
+        await asyncio.to_thread(refresh_models)
+    except Exception as e:
+        logger.error(f"Error loading cached models: {e}")
+    start_model_watcher()
+    
+    while not startup_state["catalog"]:
+        try:
+            startup_state["catalog"] = await get_catalog_snapshot() is not None
+        except Exception as e:
+            logger.error(f"Error building catalog snapshot on startup: {e}")
+        if not startup_state["catalog"]:
+            await asyncio.sleep(2)
+    
+    startup_state["ready_at"] = time.time()
+    logger.info(f"✅ Ready in {startup_state['ready_at'] - startup_state['started_at']:.2f}s "
+                f"(cached model: {startup_state['model']})")
+    
+    # With several workers only the one holding the training lock trains; the
+    # others get the model from the watcher once it is published
+    if not startup_state["model"]:
+        await asyncio.to_thread(train_in_background)
+
 # ML endpoint to manually trigger model training
 @app.post("/train")
 def train_model(db: Session = Depends(get_db)):
-    user_clusters = train_user_clusters(db)
+    with timed("model"):
+        user_clusters = train_user_clusters(db)
     if user_clusters:
         return {"status": "success", "message": f"Model trained with {len(user_clusters)} users"}
     else:
         return {"status": "error", "message": "Failed to train model or not enough data"}
 
-# Get event recommendations using the ML model
-@app.get("/recommendations", response_model=List[EventResponse])
-async def get_recommendations(
-    user_id: Optional[int] = Query(None),
-    limit: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
-):
+# Train the matrix factorisation model (strategy=mf); reports training time
+@app.post("/train/mf")
+def train_mf_model(db: Session = Depends(get_db)):
+    with timed("model"):
+        meta = train_mf(db)
+    if meta:
+        return {"status": "success", "model": meta}
+    return {"status": "error", "message": "Training already running or not enough data"}
+
+# Published cluster model versions (newest first) and the current ones
+@app.get("/models")
+def list_models():
+    cluster_model = _cluster_model
+    return {
+        "clusters": cluster_store.stats(),
+        "mf": mf_store.stats(),
+        "serving": {
+            "clusters": cluster_model[0] if cluster_model else None,
+            "mf": mf_model.meta.get("version") if mf_model else None,
+        },
+    }
+
+# Switch a model back to an earlier version (by default the one before the
+# current); other workers follow within MODEL_POLL_SECONDS
+@app.post("/models/rollback")
+def rollback_model(model: str = Query("clusters", regex="^(clusters|mf)$"),
+                   version: Optional[str] = Query(None)):
+    store = mf_store if model == "mf" else cluster_store
+    try:
+        manifest = store.activate(version) if version else store.rollback()
+    except ArtifactError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    refresh_models()
+    return {"status": "success", "model": model, "version": manifest["version"], "meta": manifest["meta"]}
+
+# Export interactions added since the last snapshot now (normally done periodically)
+@app.post("/snapshots/export")
+def export_snapshots(db: Session = Depends(get_db)):
+    return {"exported": snapshots.export_all(db), "snapshots": snapshots.stats()}
+
+# Click counts per event over the last 30 days
+def get_trending_counts(db: Session, days: int = 30) -> Dict[int, int]:
+    recent_time = datetime.utcnow() - timedelta(days=days)
+    popular_events = db.query(
+        EventClick.event_id,
+        func.count(EventClick.id).label('click_count')
+    ).filter(
+        EventClick.timestamp > recent_time
+    ).group_by(
+        EventClick.event_id
+    ).all()
+    return {event.event_id: event.click_count for event in popular_events}
+
+def load_trending_counts() -> Dict[int, int]:
+    db = SessionLocal()
+    try:
+        return get_trending_counts(db)
+    finally:
+        db.close()
+
+# Columnar catalog with trending counts, rebuilt at most every CATALOG_TTL_SECONDS.
+# One rebuild at a time: meanwhile other requests keep using the previous snapshot
+_catalog_rebuild = {"running": False}
+
+async def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    snapshot = catalog_snapshot
+    if snapshot is not None and (time.time() - snapshot.built_at < CATALOG_TTL_SECONDS
+                                 or _catalog_rebuild["running"]):
+        return snapshot
+    
+    _catalog_rebuild["running"] = True
+    try:
+        return await _rebuild_catalog_snapshot(snapshot)
+    finally:
+        _catalog_rebuild["running"] = False
+
+async def _rebuild_catalog_snapshot(snapshot: Optional[CatalogSnapshot]) -> Optional[CatalogSnapshot]:
+    global catalog_snapshot
+    
     # Fetch all events from backend
     all_events = await fetch_events_from_backend()
     
@@ -484,160 +1032,281 @@ async def get_recommendations(
         logger.warning("No events from backend, using fallback events")
         all_events = get_fallback_events()
     
-    # If we still have no events, return empty list
     if not all_events:
-        logger.error("No events available from any source")
-        return []
+        return snapshot
     
-    # For logged-in users - try to provide personalized recommendations with ML
-    if user_id:
-        logger.info(f"Generating ML-based recommendations for user {user_id}")
-        
-        # Try to get user's cluster
-        user_cluster = get_user_cluster(user_id)
-        
-        # If user has a cluster, use it for recommendations
-        if user_cluster is not None:
-            logger.info(f"User {user_id} belongs to cluster {user_cluster}")
-            
-            # Get preferred categories for this cluster
-            preferred_categories = get_cluster_preferences(user_cluster)
-            
-            if preferred_categories:
-                logger.info(f"Cluster {user_cluster} prefers categories: {preferred_categories}")
-                
-                # Get user's recent clicks to avoid recommending the same events
-                recent_time = datetime.utcnow() - timedelta(days=7)
-                user_clicks = db.query(EventClick).filter(
-                    EventClick.user_id == user_id,
-                    EventClick.timestamp > recent_time
-                ).all()
-                
-                already_seen = set(click.event_id for click in user_clicks)
-                recommended_events = []
-                
-                # Recommend events from preferred categories
-                for category in preferred_categories:
-                    if len(recommended_events) >= limit:
-                        break
-                    
-                    category_events = [event for event in all_events 
-                                      if event['category'] == category and event['id'] not in already_seen]
-                    
-                    remaining = limit - len(recommended_events)
-                    recommended_events.extend(category_events[:remaining])
-                
-                # If we have recommendations, return them
-                if recommended_events:
-                    logger.info(f"Returning {len(recommended_events)} ML-based recommendations")
-                    return recommended_events[:limit]
-        
-        # If we don't have ML recommendations, fall back to simpler approach
-        logger.info("Falling back to non-ML approach for user")
-        
-        # Get user's recent clicks (last 7 days)
-        recent_time = datetime.utcnow() - timedelta(days=7)
-        user_clicks = db.query(EventClick).filter(
-            EventClick.user_id == user_id,
-            EventClick.timestamp > recent_time
-        ).all()
-        
-        # If user has clicks history
-        if user_clicks and len(user_clicks) > 0:
-            logger.info(f"User {user_id} has {len(user_clicks)} recent clicks")
-            # Get event_ids the user clicked on
-            clicked_event_ids = [click.event_id for click in user_clicks]
-            
-            # Find the most clicked categories (simple collaborative filtering)
-            event_categories = {}
-            for event in all_events:
-                event_categories[event['id']] = event['category']
-            
-            category_counts = {}
-            for event_id in clicked_event_ids:
-                if event_id in event_categories:
-                    category = event_categories[event_id]
-                    category_counts[category] = category_counts.get(category, 0) + 1
-            
-            # Sort categories by click count
-            sorted_categories = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)
-            logger.info(f"Preferred categories: {sorted_categories}")
-            
-            # Get recommended events (those in preferred categories not already clicked)
-            recommended_events = []
-            already_seen = set(clicked_event_ids)
-            
-            # Fill with events from user's favorite categories
-            for category, _ in sorted_categories:
-                if len(recommended_events) >= limit:
-                    break
-                
-                category_events = [event for event in all_events 
-                                  if event['category'] == category and event['id'] not in already_seen]
-                
-                remaining = limit - len(recommended_events)
-                recommended_events.extend(category_events[:remaining])
-                
-            # If still need more recommendations, add trending events
-            if len(recommended_events) < limit:
-                # Add trending events not already recommended
-                remaining = limit - len(recommended_events)
-                recommended_ids = [e['id'] for e in recommended_events]
-                trending_events = [e for e in all_events 
-                                  if e['id'] not in already_seen and e['id'] not in recommended_ids]
-                
-                # Shuffle trending events to add randomness
-                random.shuffle(trending_events)
-                recommended_events.extend(trending_events[:remaining])
-                
-            if recommended_events:
-                logger.info(f"Returning {len(recommended_events)} personalized recommendations")
-                return recommended_events[:limit]
+    global degraded_recommendations
     
-    # Default strategy for new users or when personalization fails:
-    # Mix of trending and random recommendations
-    logger.info("Generating mixed trending/random recommendations")
+    index_event_categories(all_events)
+    # The trending query runs in a worker thread, off the event loop
+    snapshot = CatalogSnapshot(all_events, await run_in_context(load_trending_counts))
     
-    # Get some trending events
-    recent_time = datetime.utcnow() - timedelta(days=30)
-    popular_events = db.query(
-        EventClick.event_id,
-        func.count(EventClick.id).label('click_count')
-    ).filter(
-        EventClick.timestamp > recent_time
-    ).group_by(
-        EventClick.event_id
-    ).order_by(
-        desc('click_count')
-    ).limit(max(limit // 2, 1)).all()
+    # Precompute the degraded response: trending upcoming events, no personalisation
+    degraded_recommendations = snapshot.take(
+        top_k(static_scores(snapshot, SCORING_WEIGHTS), DEGRADED_LIST_SIZE))
+    catalog_snapshot = snapshot
+    return snapshot
+
+# Cached trending list served when /recommendations is overloaded
+def get_degraded_recommendations(limit: int) -> List[Dict[str, Any]]:
+    return (degraded_recommendations or get_fallback_events())[:limit]
+
+# Midnight UTC of a date as epoch seconds
+def day_start(day: date) -> float:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+# Blocking DB work of /recommendations runs on this pool, sized like the admission
+# limit: a request abandoned at its deadline keeps its thread until the query
+# returns, so at most that many recommendation queries run at once
+_db_executor = ThreadPoolExecutor(max_workers=admission.max_concurrent, thread_name_prefix="recommendation-db")
+
+async def run_in_context(fn, *args):
+    """Run a blocking function on the DB pool, keeping the request's context (timings)."""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, functools.partial(context.run, fn, *args))
+
+# Recent clicks and category affinity of a user, with its own session. Queries
+# are cut off at the admission deadline, since the response falls back to the
+# degraded list after it anyway
+def load_user_context(user_id: int) -> Tuple[List[int], Dict[str, float], int]:
+    db = SessionLocal()
+    try:
+        # Queries issued here are the served strategy's DB cost (see strategies.py)
+        with strategy_registry.count_queries() as queries:
+            if engine.dialect.name == "postgresql":
+                db.execute(text(f"SET LOCAL statement_timeout = {int(admission.deadline * 1000)}"))
+            recent_clicks = get_recent_clicks(db, user_id)
+            affinity = get_user_affinity(db, user_id, recent_clicks)
+        return recent_clicks, affinity, queries.count
+    finally:
+        db.close()
+
+# Category weights used to personalise the ranking: the user's ML cluster if
+# the model knows them, otherwise their own profile
+def get_user_affinity(db: Session, user_id: int, recent_clicks: List[int]) -> Dict[str, float]:
+    user_cluster = get_user_cluster(user_id)
+    if user_cluster is not None:
+        cluster_weights = get_cluster_weights(user_cluster)
+        if cluster_weights:
+            logger.info(f"User {user_id} belongs to cluster {user_cluster}, "
+                        f"preferences: {get_cluster_preferences(user_cluster)}")
+            return cluster_weights
     
-    popular_event_ids = [event.event_id for event in popular_events]
+    # Profiles are seeded from recent clicks for users who have no profile row yet
+    profile = profile_store.get(db, user_id)
+    if profile is None and recent_clicks:
+        category_counts = defaultdict(float)
+        for event_id in recent_clicks:
+            if event_id in event_categories:
+                category_counts[event_categories[event_id]] += CLICK_WEIGHT
+        if category_counts:
+            # Insert-if-absent: a row another worker created meanwhile is kept as is
+            profile = profile_store.seed(db, user_id, list(category_counts.items()))
     
-    # First, try to fill with trending events
-    trending_recommendations = [event for event in all_events if event['id'] in popular_event_ids]
+    if profile is not None and profile.weights:
+        logger.info(f"Preferred categories for user {user_id}: {profile.top_categories()}")
+        return profile.weights
+    return {}
+
+# MF: item factors reordered to the snapshot's rows, cached per (snapshot, model)
+# (one tuple, replaced as a whole, since shadow runs read it from other threads)
+_mf_aligned: Dict[str, Any] = {"entry": (None, None, None)}
+
+def mf_item_factors(snapshot: CatalogSnapshot, model: mf.MFModel):
+    key = (id(snapshot), snapshot.built_at, model.meta.get("version"))
+    entry = _mf_aligned["entry"]
+    if entry[0] != key:
+        model_rows = model.item_rows(snapshot.ids)
+        known = np.flatnonzero(model_rows >= 0)
+        entry = (key, known, np.ascontiguousarray(model.item_factors[model_rows[known]]))
+        _mf_aligned["entry"] = entry
+    return entry[1], entry[2]
+
+# MF: Snapshot rows ranked by factor dot products, or None if the user is unknown to the model
+def mf_rank(snapshot: CatalogSnapshot, user_id: Optional[int], limit: int,
+            excluded: np.ndarray, record_latency: bool = True) -> Optional[np.ndarray]:
+    model = mf_model
+    if model is None or user_id is None:
+        return None
+    user_vector = model.user_vector(user_id)
+    if user_vector is None:
+        return None
+    started = time.perf_counter()
+    rows, factors = mf_item_factors(snapshot, model)
+    scores = np.full(len(snapshot), -np.inf, dtype=np.float32)
+    scores[rows] = factors @ user_vector
+    scores[excluded] = -np.inf
+    ranked = top_k(scores, limit, snapshot.category_codes, MAX_PER_CATEGORY)
+    if record_latency:
+        mf_latency.observe(time.perf_counter() - started)
+    return ranked
+
+# Strategies: each ranks the filtered catalog for one request (see strategies.py)
+
+# Category affinity (cluster or decayed profile) plus trending and recency;
+# anonymous users get trending and recency only
+def rank_default(request: RankRequest) -> np.ndarray:
+    snapshot, recent_clicks = request.snapshot, request.recent_clicks
+    affinity = snapshot.affinity_vector(request.affinity)
     
-    # If not enough trending events, get random ones to fill
-    if len(trending_recommendations) < limit:
-        remaining = limit - len(trending_recommendations)
-        already_recommended = set(e['id'] for e in trending_recommendations)
-        
-        # Get all events not already recommended
-        other_events = [event for event in all_events if event['id'] not in already_recommended]
-        
-        # Shuffle them for randomness
-        random.shuffle(other_events)
-        
-        # Add random events to recommendations
-        trending_recommendations.extend(other_events[:remaining])
+    # One vectorised pass over the whole catalog
+    scores = score(snapshot, affinity, request.excluded | snapshot.seen_mask(recent_clicks), SCORING_WEIGHTS)
+    rows = top_k(scores, request.limit, snapshot.category_codes, MAX_PER_CATEGORY)
     
-    # If still not enough, just return random selection
-    if not trending_recommendations:
-        random_selection = random.sample(all_events, min(limit, len(all_events)))
-        logger.info(f"Returning {len(random_selection)} random recommendations")
-        return random_selection
+    # If the user has seen every matching event, ignore the seen set rather than return nothing
+    if rows.size == 0 and recent_clicks:
+        scores = score(snapshot, affinity, request.excluded, SCORING_WEIGHTS)
+        rows = top_k(scores, request.limit, snapshot.category_codes, MAX_PER_CATEGORY)
+    return rows
+
+# Trending and recency only, no personalisation and no DB queries
+def rank_trending(request: RankRequest) -> np.ndarray:
+    snapshot = request.snapshot
+    scores = score(snapshot, np.empty(0), request.excluded | snapshot.seen_mask(request.recent_clicks),
+                   SCORING_WEIGHTS)
+    return top_k(scores, request.limit, snapshot.category_codes, MAX_PER_CATEGORY)
+
+# Matrix factorisation ranks individual events; users the model has not seen,
+# and slots it cannot fill (events newer than the model), use the default ranking
+def rank_mf(request: RankRequest) -> np.ndarray:
+    seen = request.snapshot.seen_mask(request.recent_clicks)
+    mf_rows = mf_rank(request.snapshot, request.user_id, request.limit, request.excluded | seen,
+                      record_latency=not request.shadow)
+    if mf_rows is None:
+        return rank_default(request)
+    if mf_rows.size >= request.limit:
+        return mf_rows
+    excluded = request.excluded.copy()
+    excluded[mf_rows] = True
+    rest = rank_default(replace(request, limit=request.limit - mf_rows.size, excluded=excluded))
+    return np.concatenate([mf_rows, rest])
+
+# Served strategy: RECOMMENDATION_STRATEGY, or a per-user split such as
+# RECOMMENDATION_TRAFFIC_SPLIT="default:90,mf:10"; ?strategy= overrides both
+strategy_registry = StrategyRegistry(
+    engine,
+    default=os.getenv("RECOMMENDATION_STRATEGY", "default"),
+    split=os.getenv("RECOMMENDATION_TRAFFIC_SPLIT", ""),
+)
+strategy_registry.register("default", rank_default)
+strategy_registry.register("trending", rank_trending)
+strategy_registry.register("mf", rank_mf)
+
+# Strategies also run in shadow mode for every request, after the response is
+# sent, on a bounded pool; their results are only measured, never served, and
+# a shadow run has no side effects (no DB access, no serving latency stats)
+SHADOW_STRATEGIES = [name for name in (n.strip() for n in os.getenv("RECOMMENDATION_SHADOW_STRATEGIES", "").split(","))
+                     if name in strategy_registry]
+shadow_runner = ShadowRunner(
+    workers=int(os.getenv("SHADOW_WORKERS", "2")),
+    max_queue=int(os.getenv("SHADOW_QUEUE", "32")),
+)
+
+def run_shadow(name: str, request: RankRequest, served: np.ndarray):
+    rows = strategy_registry.run(name, replace(request, shadow=True), mode="shadow")
+    strategy_registry.record_overlap(name, rows, served)
+
+def submit_shadows(served_name: str, request: RankRequest, served: np.ndarray):
+    for name in SHADOW_STRATEGIES:
+        if name != served_name:
+            shadow_runner.submit(lambda name=name: run_shadow(name, request, served))
+
+# Per-strategy latency, DB queries and hit/empty rates, and shadow pool counters
+@app.get("/strategies")
+def list_strategies():
+    return {
+        "strategies": strategy_registry.names(),
+        "default": strategy_registry.default,
+        "traffic_split": dict(strategy_registry.split.shares),
+        "shadow": SHADOW_STRATEGIES,
+        "stats": strategy_registry.stats(),
+        "shadow_runner": shadow_runner.stats(),
+    }
+
+# Get event recommendations using the ML model
+@app.get("/recommendations", response_model=List[EventResponse])
+async def get_recommendations(
+    response: Response,
+    background_tasks: BackgroundTasks,
+    user_id: Optional[int] = Query(None),
+    limit: int = Query(5, ge=1, le=20),
+    category: Optional[List[str]] = Query(None),
+    max_price: Optional[float] = Query(None, ge=0),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    exclude_past: bool = Query(False),
+    strategy: Optional[str] = Query(None),
+):
+    if strategy is not None and strategy not in strategy_registry:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy '{strategy}', "
+                                                    f"available: {', '.join(strategy_registry.names())}")
+    served_name = strategy or strategy_registry.choose(user_id)
+    response.headers["X-Recommendation-Strategy"] = served_name
+    
+    async def compute():
+        return await compute_recommendations(user_id, limit, category, max_price,
+                                             date_from, date_to, exclude_past, served_name,
+                                             background_tasks)
+    
+    def degraded():
+        response.headers["X-Recommendation-Mode"] = "degraded"
+        return get_degraded_recommendations(limit)
+    
+    events = await admission.run(compute, degraded)
+    if not fastjson.ENABLED:
+        return events
+    
+    # Fast path: rows built in EventResponse shape and encoded directly. A returned
+    # Response replaces the injected one, so its headers are carried over
+    headers = {name: response.headers[name] for name in ("X-Recommendation-Strategy", "X-Recommendation-Mode")
+               if name in response.headers}
+    with timed("serialization"):
+        content = fastjson.dumps([response_row(event) for event in events])
+    return Response(content=content, media_type="application/json", headers=headers)
+
+async def compute_recommendations(
+    user_id: Optional[int],
+    limit: int,
+    category: Optional[List[str]] = None,
+    max_price: Optional[float] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exclude_past: bool = False,
+    strategy: str = "default",
+    background_tasks: Optional[BackgroundTasks] = None,
+) -> List[Dict[str, Any]]:
+    snapshot = await get_catalog_snapshot()
+    
+    # If we have no events, return empty list
+    if snapshot is None or len(snapshot) == 0:
+        logger.error("No events available from any source")
+        return []
+    
+    # Filters are combined from the snapshot's precomputed masks; events outside
+    # them are excluded exactly like already seen ones
+    excluded = ~snapshot.filter_mask(
+        categories=category,
+        max_price=max_price,
+        date_from=day_start(date_from) if date_from else None,
+        date_to=day_start(date_to) + 24 * 3600 - 1 if date_to else None,
+        exclude_past=exclude_past,
+    )
     
-    logger.info(f"Returning {len(trending_recommendations)} mixed recommendations")
-    return trending_recommendations[:limit]
+    # User's recent clicks (never recommended again) and category affinity, loaded
+    # in a worker thread; the strategies then rank on the loop without DB access
+    recent_clicks, affinity, queries = await run_in_context(load_user_context, user_id) if user_id else ([], {}, 0)
+    
+    request = RankRequest(snapshot, user_id, limit, excluded, recent_clicks, affinity, queries=queries)
+    with timed("model"):
+        rows = strategy_registry.run(strategy, request)
+    if background_tasks is not None and SHADOW_STRATEGIES:
+        background_tasks.add_task(submit_shadows, strategy, request, rows)
+    
+    logger.info(f"Returning {rows.size} recommendations for user {user_id} (strategy {strategy})")
+    return snapshot.take(rows)
+
+if PRELOAD_MODELS:
+    preload_models()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from artifacts import ArtifactStore
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ALSConfig:
+    factors: int = 32
+    regularization: float = 0.05
+    alpha: float = 20.0  # Confidence per unit of interaction weight: c = 1 + alpha * r
+    iterations: int = 10
+    threads: int = field(default_factory=lambda: os.cpu_count() or 1)
+    block_nnz: int = 2048  # Interactions per solver block (bounds the f x f temporaries)
+    seed: int = 42
+
+
+def build_matrix(user_ids: np.ndarray, item_ids: np.ndarray, weights: np.ndarray):
+    """Sparse users x items matrix of summed interaction weights, with the sorted id arrays of its rows and columns."""
+    users, user_rows = np.unique(user_ids, return_inverse=True)
+    items, item_cols = np.unique(item_ids, return_inverse=True)
+    matrix = sparse.csr_matrix((weights.astype(np.float64), (user_rows, item_cols)),
+                               shape=(len(users), len(items)))
+    matrix.sum_duplicates()
+    return matrix, users.astype(np.int64), items.astype(np.int64)
+
+
+def _blocks(indptr: np.ndarray, max_nnz: int) -> List[Tuple[int, int]]:
+    # Consecutive row ranges holding at most max_nnz interactions (a heavier row gets its own block)
+    blocks, start, n_rows = [], 0, len(indptr) - 1
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + max_nnz, side="right")) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def _solve_block(matrix: sparse.csr_matrix, other: np.ndarray, gram: np.ndarray,
+                 start: int, stop: int, config: ALSConfig) -> np.ndarray:
+    """
+    Exact implicit-ALS solve for rows start..stop:
+    x_u = (YtY + Yu^T (C_u - I) Yu + reg I)^-1 Yu^T C_u p_u, with p_u = 1 on observed items.
+    """
+    n = stop - start
+    lo, hi = matrix.indptr[start], matrix.indptr[stop]
+    counts = np.diff(matrix.indptr[start:stop + 1])
+    conf = config.alpha * matrix.data[lo:hi]
+    factors = other[matrix.indices[lo:hi]]
+
+    lhs = np.broadcast_to(gram, (n,) + gram.shape).copy()
+    rhs = np.zeros((n, other.shape[1]))
+    nonempty = counts > 0
+    if hi > lo:
+        if n == 1:
+            # A single (possibly very heavy) row: plain products, no per-interaction temporaries
+            lhs[0] += (factors.T * conf) @ factors
+            rhs[0] = factors.T @ (1.0 + conf)
+        else:
+            offsets = (matrix.indptr[start:stop] - lo)[nonempty]
+            outer = conf[:, None, None] * factors[:, :, None] * factors[:, None, :]
+            lhs[nonempty] += np.add.reduceat(outer, offsets, axis=0)
+            rhs[nonempty] = np.add.reduceat((1.0 + conf)[:, None] * factors, offsets, axis=0)
+    # One batched LAPACK call per block; it releases the GIL, so blocks solve in parallel threads
+    return np.linalg.solve(lhs, rhs[..., None])[..., 0]
+
+
+def _solve_all(pool: ThreadPoolExecutor, matrix: sparse.csr_matrix, other: np.ndarray,
+               config: ALSConfig) -> np.ndarray:
+    gram = other.T @ other + config.regularization * np.eye(other.shape[1])
+    result = np.empty((matrix.shape[0], other.shape[1]))
+    blocks = _blocks(matrix.indptr, config.block_nnz)
+    for (start, stop), solved in zip(blocks, pool.map(
+            lambda b: _solve_block(matrix, other, gram, b[0], b[1], config), blocks)):
+        result[start:stop] = solved
+    return result
+
+
+def train_als(matrix: sparse.csr_matrix, config: ALSConfig = ALSConfig()) -> Tuple[np.ndarray, np.ndarray]:
+    """Implicit-feedback ALS (Hu, Koren, Volinsky). Returns user and item factors as float32."""
+    rng = np.random.default_rng(config.seed)
+    users = rng.normal(0, 0.01, (matrix.shape[0], config.factors))
+    items = rng.normal(0, 0.01, (matrix.shape[1], config.factors))
+    transposed = matrix.T.tocsr()
+    with ThreadPoolExecutor(max_workers=config.threads, thread_name_prefix="als") as pool:
+        for _ in range(config.iterations):
+            users = _solve_all(pool, matrix, items, config)
+            items = _solve_all(pool, transposed, users, config)
+    return users.astype(np.float32), items.astype(np.float32)
+
+
+class MFModel:
+    """
+    User and item factor arrays with the ids of their rows (both sorted).
+
+    Scores are dot products of factors. Top-k is computed in blocks of items so
+    only a users x ``block_items`` score block is ever materialised, keeping a
+    running best-k per user that is merged with ``argpartition``.
+    """
+
+    def __init__(self, user_ids: np.ndarray, item_ids: np.ndarray,
+                 user_factors: np.ndarray, item_factors: np.ndarray, meta: Optional[Dict] = None):
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.meta = meta or {}
+
+    # --- lookup ---------------------------------------------------------
+
+    def _positions(self, ids: np.ndarray, keys: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(keys) == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(keys, ids)
+        pos[pos >= len(keys)] = 0
+        return np.where(keys[pos] == ids, pos, -1)
+
+    def user_rows(self, user_ids) -> np.ndarray:
+        return self._positions(user_ids, self.user_ids)
+
+    def item_rows(self, item_ids) -> np.ndarray:
+        """Model rows of the given event ids, -1 for events the model has not seen."""
+        return self._positions(item_ids, self.item_ids)
+
+    def user_vector(self, user_id: int) -> Optional[np.ndarray]:
+        row = int(self.user_rows([user_id])[0])
+        return None if row < 0 else self.user_factors[row]
+
+    # --- serving --------------------------------------------------------
+
+    def top_k(self, user_rows: np.ndarray, k: int, exclude: Optional[List[np.ndarray]] = None,
+              block_items: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Best ``k`` item rows per user (best first) and their scores, for a batch
+        of user rows. ``exclude`` optionally holds, per user, item rows to skip.
+        Rows with fewer than ``k`` candidates are padded with -1 / -inf.
+        """
+        queries = np.asarray(self.user_factors[user_rows], dtype=np.float32)
+        n_users, n_items = len(queries), len(self.item_ids)
+        k = min(k, n_items)
+        best_rows = np.full((n_users, k), -1, dtype=np.int64)
+        best_scores = np.full((n_users, k), -np.inf, dtype=np.float32)
+        if k == 0 or n_users == 0:
+            return best_rows, best_scores
+
+        excluded = None
+        if exclude is not None:
+            excluded = (np.repeat(np.arange(n_users), [len(e) for e in exclude]),
+                        np.concatenate(exclude).astype(np.int64))
+
+        for start in range(0, n_items, block_items):
+            stop = min(start + block_items, n_items)
+            scores = queries @ self.item_factors[start:stop].T
+            if excluded is not None:
+                in_block = (excluded[1] >= start) & (excluded[1] < stop)
+                scores[excluded[0][in_block], excluded[1][in_block] - start] = -np.inf
+            rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_rows = np.concatenate([best_rows, rows], axis=1)
+            keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+            best_rows = np.take_along_axis(merged_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_rows[~np.isfinite(best_scores)] = -1
+        return best_rows, best_scores
+
+    def recommend(self, user_ids, k: int, exclude: Optional[List[np.ndarray]] = None) -> List[List[int]]:
+        """Event ids of the best ``k`` events for each user id (empty for users unknown to the model)."""
+        rows = self.user_rows(user_ids)
+        known = np.flatnonzero(rows >= 0)
+        result: List[List[int]] = [[] for _ in rows]
+        if known.size:
+            top, _ = self.top_k(rows[known], k, [exclude[i] for i in known] if exclude is not None else None)
+            for i, items in zip(known, top):
+                result[i] = self.item_ids[items[items >= 0]].tolist()
+        return result
+
+    # --- persistence ----------------------------------------------------
+
+    ARRAYS = ("user_ids", "item_ids", "user_factors", "item_factors")
+
+    def publish(self, store: ArtifactStore) -> str:
+        """
+        Publishes the factor arrays as a new version of ``store`` (see
+        artifacts.py: checksummed, switched atomically, kept for rollback)
+        and returns the version.
+        """
+        files = {f"{name}.npy": (lambda f, name=name: np.save(f, getattr(self, name))) for name in self.ARRAYS}
+        version = store.publish(files, modes={}, meta=self.meta)
+        self.meta["version"] = version
+        return version
+
+    @classmethod
+    def load(cls, store: ArtifactStore, version: str) -> "MFModel":
+        """``version`` of ``store``, memory-mapped after checksum validation."""
+        manifest = store.validate(version)
+        arrays = {name: np.load(store.path(version, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        return cls(meta={**manifest["meta"], "version": version}, **arrays)
+
+    @classmethod
+    def load_legacy(cls, version_dir: str) -> "MFModel":
+        """A model saved before the artifact store: ``<version>/*.npy`` and ``meta.json``."""
+        arrays = {name: np.load(os.path.join(version_dir, f"{name}.npy")) for name in cls.ARRAYS}
+        with open(os.path.join(version_dir, "meta.json"), "r") as f:
+            meta = json.load(f)
+        meta.pop("version", None)
+        return cls(meta=meta, **arrays)
+
+
+def fit(user_ids: np.ndarray, item_ids: np.ndarray, weights: np.ndarray,
+        config: ALSConfig = ALSConfig()) -> MFModel:
+    """Builds the interaction matrix and trains a model, recording timings in ``meta``."""
+    started = time.perf_counter()
+    matrix, users, items = build_matrix(user_ids, item_ids, weights)
+    built = time.perf_counter()
+    user_factors, item_factors = train_als(matrix, config)
+    finished = time.perf_counter()
+    meta = {
+        "config": asdict(config),
+        "users": int(matrix.shape[0]),
+        "items": int(matrix.shape[1]),
+        "interactions": int(matrix.nnz),
+        "matrix_seconds": round(built - started, 3),
+        "training_seconds": round(finished - built, 3),
+        "trained_at": time.time(),
+    }
+    logger.info(f"ALS trained on {meta['users']} users x {meta['items']} items "
+                f"({meta['interactions']} interactions) in {meta['training_seconds']}s")
+    return MFModel(users, items, user_factors, item_factors, meta)
+
+
+class LatencyStats:
+    """Count, mean and max of serving latencies (seconds)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+        }
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db_models import UserProfile
+from seen_cache import to_epoch
+
+
+class Profile:
+    """Category affinity of one user; ``weights`` are valid as of ``updated_at`` (epoch seconds)."""
+
+    __slots__ = ("weights", "updated_at", "interaction_count")
+
+    def __init__(self, weights: Dict[str, float], updated_at: float, interaction_count: int = 0):
+        self.weights = weights
+        self.updated_at = updated_at
+        self.interaction_count = interaction_count
+
+    def decayed(self, half_life_seconds: float, now: Optional[float] = None) -> Dict[str, float]:
+        now = time.time() if now is None else now
+        factor = decay_factor(now - self.updated_at, half_life_seconds)
+        return {category: weight * factor for category, weight in self.weights.items()}
+
+    def top_categories(self) -> List[str]:
+        # Decay scales every weight equally, so the order can be read from the stored weights
+        return [category for category, weight in
+                sorted(self.weights.items(), key=lambda x: x[1], reverse=True) if weight > 0]
+
+
+def decay_factor(elapsed_seconds: float, half_life_seconds: float) -> float:
+    if elapsed_seconds <= 0:
+        return 1.0
+    return math.pow(0.5, elapsed_seconds / half_life_seconds)
+
+
+class ProfileStore:
+    """
+    ``user_profiles`` feature store with an in-memory LRU cache in front of it.
+
+    Each interaction decays the stored weights to the interaction time and adds
+    its weight to the event's category, so reading a profile is a single row
+    lookup (or a cache hit) instead of an aggregation over click history.
+
+    Only existing profiles are cached: a user without a row is looked up again
+    on the next read, since another worker may have created it meanwhile.
+    Cached profiles are re-read after ``ttl_seconds``, so updates written by
+    other workers show up here within that time. Updates always lock and
+    decay the stored row, never the cached copy.
+    """
+
+    # Weights below this are dropped to keep rows small
+    MIN_WEIGHT = 0.01
+
+    def __init__(self, half_life_days: float = 14, max_users: int = 10000, ttl_seconds: float = 60):
+        self.half_life_seconds = half_life_days * 24 * 3600
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._cache: "OrderedDict[int, Tuple[float, Profile]]" = OrderedDict()  # user -> (cached at, profile)
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int) -> Optional[Profile]:
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self._cache.move_to_end(user_id)
+                return entry[1]
+
+        row = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        if row is None:
+            return None
+        profile = self._from_row(row)
+        self._remember(user_id, profile)
+        return profile
+
+    def seed(self, db: Session, user_id: int, interactions: List[Tuple[str, float]],
+             timestamp: Optional[datetime] = None) -> Profile:
+        """
+        Create the profile from past interactions unless a row exists already.
+        If another worker created (or updated) the row first, that row is
+        returned unchanged, so the same interactions are never counted twice.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        weights: Dict[str, float] = {}
+        for category, weight in interactions:
+            weights[category] = weights.get(category, 0.0) + weight
+        db.execute(
+            insert(UserProfile)
+            .values(user_id=user_id, category_weights={c: round(w, 4) for c, w in weights.items()},
+                    interaction_count=len(interactions), updated_at=timestamp)
+            .on_conflict_do_nothing(index_elements=[UserProfile.user_id])
+        )
+        db.commit()
+        row = db.query(UserProfile).filter(UserProfile.user_id == user_id).one()
+        profile = self._from_row(row)
+        self._remember(user_id, profile)
+        return profile
+
+    def record(self, db: Session, user_id: int, category: str, weight: float,
+               timestamp: Optional[datetime] = None) -> Profile:
+        """Apply one interaction to the user's profile and persist it."""
+        return self.record_many(db, user_id, [(category, weight)], timestamp)
+
+    def record_many(self, db: Session, user_id: int, interactions: List[Tuple[str, float]],
+                    timestamp: Optional[datetime] = None) -> Profile:
+        timestamp = timestamp or datetime.utcnow()
+        try:
+            return self._apply(db, user_id, interactions, timestamp)
+        except IntegrityError:
+            # Another worker created the row first; it is locked normally on retry
+            db.rollback()
+            return self._apply(db, user_id, interactions, timestamp)
+
+    def _apply(self, db: Session, user_id: int, interactions: List[Tuple[str, float]],
+               timestamp: datetime) -> Profile:
+        now = to_epoch(timestamp)
+
+        # Row lock keeps concurrent updates from several workers from losing increments
+        row = db.query(UserProfile).filter(UserProfile.user_id == user_id).with_for_update().first()
+        if row is None:
+            row = UserProfile(user_id=user_id, category_weights={}, interaction_count=0,
+                              updated_at=timestamp)
+            db.add(row)
+            weights = {}
+        else:
+            weights = self._from_row(row).decayed(self.half_life_seconds, now)
+
+        for category, weight in interactions:
+            weights[category] = weights.get(category, 0.0) + weight
+
+        row.category_weights = {c: round(w, 4) for c, w in weights.items() if w >= self.MIN_WEIGHT}
+        row.interaction_count = (row.interaction_count or 0) + len(interactions)
+        row.updated_at = max(row.updated_at or timestamp, timestamp)
+        db.commit()
+
+        profile = self._from_row(row)
+        self._remember(user_id, profile)
+        return profile
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def feature_matrix(self, db: Session, categories: Optional[List[str]] = None):
+        """
+        Decayed affinity of every profiled user as a dense matrix for training.
+
+        Returns ``(user_ids, categories, matrix)`` where ``matrix[i, j]`` is the
+        affinity of ``user_ids[i]`` for ``categories[j]``.
+        """
+        rows = db.query(UserProfile).all()
+        profiles = [(row.user_id, self._from_row(row)) for row in rows]
+        if categories is None:
+            categories = sorted({c for _, p in profiles for c in p.weights})
+        column = {category: j for j, category in enumerate(categories)}
+
+        now = time.time()
+        matrix = np.zeros((len(profiles), len(categories)), dtype=np.float32)
+        for i, (_, profile) in enumerate(profiles):
+            for category, weight in profile.decayed(self.half_life_seconds, now).items():
+                j = column.get(category)
+                if j is not None:
+                    matrix[i, j] = weight
+        return [user_id for user_id, _ in profiles], categories, matrix
+
+    def stats(self):
+        with self._lock:
+            return {"cached_profiles": len(self._cache)}
+
+    @staticmethod
+    def _from_row(row: UserProfile) -> Profile:
+        return Profile(dict(row.category_weights or {}), to_epoch(row.updated_at),
+                       row.interaction_count or 0)
+
+    def _remember(self, user_id: int, profile: Profile):
+        with self._lock:
+            self._cache[user_id] = (time.monotonic(), profile)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.max_users:
+                self._cache.popitem(last=False)
@@ -0,0 +1,267 @@
+"""
+Offline replay evaluation of recommendation strategies.
+
+Clicks are split in time: everything before the split point is the training
+window, the following ``--test-days`` are the future window. Each strategy is
+fitted on the training window only, then every user who clicked in both
+windows is replayed: the strategy recommends ``k`` events (excluding events
+the user already clicked in training) and the recommendation is scored
+against the events the user clicked in the future window.
+
+Users are replayed in a process pool. For each strategy the report holds
+hit-rate@k, NDCG@k, recall@k, the per-request latency distribution, the total
+CPU time spent by the workers and the fitting time. It is printed and written
+as JSON, so two runs (e.g. before and after a change) can be compared.
+
+Nothing here touches Postgres: clicks come from the interaction snapshot
+(snapshots.py) or from an NDJSON/CSV export of /export/clicks, and events from
+an export of the backend's /export/events (or a saved /events/ response).
+
+    python replay.py --snapshot-dir /app/data/snapshots --events events.ndjson \\
+        --test-days 7 --k 10 --strategies trending,default,mf --output replay.json
+"""
+import argparse
+import csv
+import gzip
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import mf
+from catalog import CatalogSnapshot, parse_date
+from profiles import decay_factor
+from scoring import ScoringWeights, score, top_k
+
+DAY = 24 * 3600
+TRENDING_DAYS = 30  # Matches get_trending_counts in main.py
+PROFILE_HALF_LIFE_DAYS = float(os.getenv("PROFILE_HALF_LIFE_DAYS", "14"))
+
+
+# --- input ------------------------------------------------------------------
+
+def _open(path: str):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path, "r")
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """Rows of an NDJSON, CSV or JSON-array file (optionally gzipped)."""
+    with _open(path) as f:
+        if ".csv" in path:
+            return list(csv.DictReader(f))
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def load_clicks(snapshot_dir: Optional[str], clicks_path: Optional[str]) -> Dict[str, np.ndarray]:
+    if snapshot_dir:
+        from snapshots import InteractionSnapshots
+        columns = InteractionSnapshots(snapshot_dir).load("clicks", ("user_id", "event_id", "timestamp"))
+        return {c: np.asarray(values) for c, values in columns.items()}
+    records = read_records(clicks_path)
+    return {
+        "user_id": np.array([int(r["user_id"]) if r.get("user_id") not in (None, "") else -1 for r in records],
+                            dtype=np.int64),
+        "event_id": np.array([int(r["event_id"]) for r in records], dtype=np.int64),
+        "timestamp": np.array([parse_date(r["timestamp"]) for r in records], dtype=np.float64),
+    }
+
+
+# --- strategies ---------------------------------------------------------------
+# Offline counterparts of the service strategies, built from the same scoring
+# and MF code but fitted on the training window instead of live state.
+
+class ReplayState:
+    """Everything a worker needs: catalog, training history per user and fitted models."""
+
+    def __init__(self, events: List[Dict[str, Any]], train: Dict[str, np.ndarray], split: float,
+                 strategies: List[str], mf_config: mf.ALSConfig):
+        self.split = split
+        self.fit_seconds: Dict[str, float] = {}
+
+        started = time.perf_counter()
+        recent = train["timestamp"] > split - TRENDING_DAYS * DAY
+        event_ids, counts = np.unique(train["event_id"][recent], return_counts=True)
+        self.snapshot = CatalogSnapshot(events, dict(zip(event_ids.tolist(), counts.tolist())))
+        self.weights = ScoringWeights(noise=0.0)  # Deterministic ranking
+        self.fit_seconds["trending"] = time.perf_counter() - started
+
+        # Clicked events and decayed category affinity (as in ProfileStore) per user
+        started = time.perf_counter()
+        known = train["user_id"] >= 0
+        self.seen: Dict[int, List[int]] = {}
+        self.affinity: Dict[int, np.ndarray] = {}
+        half_life = PROFILE_HALF_LIFE_DAYS * DAY
+        for user_id, event_id, ts in zip(train["user_id"][known].tolist(), train["event_id"][known].tolist(),
+                                         train["timestamp"][known].tolist()):
+            self.seen.setdefault(user_id, []).append(event_id)
+            row = self.snapshot.index.get(event_id)
+            if row is not None:
+                vector = self.affinity.setdefault(user_id, np.zeros(len(self.snapshot.categories)))
+                vector[self.snapshot.category_codes[row]] += decay_factor(split - ts, half_life)
+        self.fit_seconds["default"] = time.perf_counter() - started + self.fit_seconds["trending"]
+
+        self.model = None
+        if "mf" in strategies and known.any():
+            started = time.perf_counter()
+            self.model = mf.fit(train["user_id"][known], train["event_id"][known],
+                                np.ones(int(known.sum())), mf_config)
+            model_rows = self.model.item_rows(self.snapshot.ids)
+            self.mf_rows = np.flatnonzero(model_rows >= 0)
+            self.mf_factors = np.ascontiguousarray(self.model.item_factors[model_rows[self.mf_rows]])
+            self.fit_seconds["mf"] = time.perf_counter() - started
+
+    def recommend(self, strategy: str, user_id: int, k: int) -> np.ndarray:
+        snapshot = self.snapshot
+        seen = snapshot.seen_mask(self.seen.get(user_id, []))
+        if strategy == "mf" and self.model is not None:
+            user_vector = self.model.user_vector(user_id)
+            if user_vector is not None:
+                scores = np.full(len(snapshot), -np.inf, dtype=np.float32)
+                scores[self.mf_rows] = self.mf_factors @ user_vector
+                scores[seen] = -np.inf
+                return snapshot.ids[top_k(scores, k)]
+        affinity = self.affinity.get(user_id, np.empty(0)) if strategy != "trending" else np.empty(0)
+        scores = score(snapshot, affinity, seen, self.weights, now=self.split)
+        return snapshot.ids[top_k(scores, k)]
+
+
+# --- workers ------------------------------------------------------------------
+
+_state: Optional[ReplayState] = None
+
+
+def _init_worker(state: ReplayState):
+    global _state
+    _state = state
+
+
+def _replay_chunk(strategy: str, users: List[int], truth: List[List[int]], k: int) -> Dict[str, Any]:
+    cpu_started = time.process_time()
+    latencies, hits, ndcg, recall = [], 0, 0.0, 0.0
+    for user_id, relevant in zip(users, truth):
+        started = time.perf_counter()
+        recommended = _state.recommend(strategy, user_id, k)
+        latencies.append(time.perf_counter() - started)
+
+        relevant = set(relevant)
+        gains = [1.0 if int(e) in relevant else 0.0 for e in recommended]
+        if any(gains):
+            hits += 1
+        dcg = sum(g / math.log2(i + 2) for i, g in enumerate(gains))
+        ideal = sum(1.0 / math.log2(i + 2) for i in range(min(k, len(relevant))))
+        ndcg += dcg / ideal if ideal else 0.0
+        recall += sum(gains) / len(relevant)
+    return {"latencies": latencies, "hits": hits, "ndcg": ndcg, "recall": recall,
+            "cpu_seconds": time.process_time() - cpu_started}
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000
+    return {
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p90_ms": round(float(np.percentile(ms, 90)), 4),
+        "p99_ms": round(float(np.percentile(ms, 99)), 4),
+        "max_ms": round(float(ms.max()), 4),
+    }
+
+
+def evaluate(state: ReplayState, future: Dict[int, List[int]], strategies: List[str], k: int,
+             workers: int, chunk_size: int = 500) -> Dict[str, Any]:
+    users = sorted(future)
+    chunks = [users[i:i + chunk_size] for i in range(0, len(users), chunk_size)]
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as pool:
+        for strategy in strategies:
+            wall_started = time.perf_counter()
+            parts = list(pool.map(_replay_chunk, [strategy] * len(chunks), chunks,
+                                  [[future[u] for u in chunk] for chunk in chunks], [k] * len(chunks)))
+            wall = time.perf_counter() - wall_started
+            latencies = [latency for part in parts for latency in part["latencies"]]
+            n = len(latencies)
+            results[strategy] = {
+                "users": n,
+                f"hit_rate@{k}": round(sum(p["hits"] for p in parts) / n, 4) if n else None,
+                f"ndcg@{k}": round(sum(p["ndcg"] for p in parts) / n, 4) if n else None,
+                f"recall@{k}": round(sum(p["recall"] for p in parts) / n, 4) if n else None,
+                "latency": _percentiles(latencies),
+                "cpu_seconds": round(sum(p["cpu_seconds"] for p in parts), 3),
+                "wall_seconds": round(wall, 3),
+                "fit_seconds": round(state.fit_seconds.get(strategy, 0.0), 3),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--snapshot-dir", help="interaction snapshot directory (snapshots.py)")
+    source.add_argument("--clicks", help="NDJSON/CSV export of /export/clicks (may be .gz)")
+    parser.add_argument("--events", required=True, help="NDJSON/CSV export of /export/events or a JSON array")
+    parser.add_argument("--split", help="split point (ISO date); default: last click minus --test-days")
+    parser.add_argument("--test-days", type=float, default=7)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--strategies", default="trending,default,mf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--mf-factors", type=int, default=32)
+    parser.add_argument("--mf-iterations", type=int, default=10)
+    parser.add_argument("--output", default="replay.json")
+    args = parser.parse_args()
+
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    clicks = load_clicks(args.snapshot_dir, args.clicks)
+    events = read_records(args.events)
+    for event in events:
+        event["id"] = int(event["id"])
+
+    if args.split:
+        split = datetime.fromisoformat(args.split).replace(tzinfo=timezone.utc).timestamp()
+    else:
+        split = float(np.nanmax(clicks["timestamp"])) - args.test_days * DAY
+    end = split + args.test_days * DAY
+
+    in_train = clicks["timestamp"] <= split
+    train = {c: values[in_train] for c, values in clicks.items()}
+    in_test = (clicks["timestamp"] > split) & (clicks["timestamp"] <= end) & (clicks["user_id"] >= 0)
+
+    # Future clicks of users who also have training history, minus events already clicked then
+    train_users = set(np.unique(train["user_id"]).tolist())
+    seen = {}
+    for user_id, event_id in zip(train["user_id"].tolist(), train["event_id"].tolist()):
+        seen.setdefault(user_id, set()).add(event_id)
+    future: Dict[int, List[int]] = {}
+    for user_id, event_id in zip(clicks["user_id"][in_test].tolist(), clicks["event_id"][in_test].tolist()):
+        if user_id in train_users and event_id not in seen.get(user_id, ()):
+            future.setdefault(user_id, [])
+            if event_id not in future[user_id]:
+                future[user_id].append(event_id)
+
+    state = ReplayState(events, train, split, strategies,
+                        mf.ALSConfig(factors=args.mf_factors, iterations=args.mf_iterations))
+    report = {
+        "split": datetime.fromtimestamp(split, timezone.utc).isoformat(),
+        "test_days": args.test_days,
+        "k": args.k,
+        "train_clicks": int(in_train.sum()),
+        "test_users": len(future),
+        "events": len(events),
+        "workers": args.workers,
+        "strategies": evaluate(state, future, strategies, args.k, args.workers),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import cProfile
+import itertools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Per-request timing: every SQL statement is counted and timed through engine
+# event listeners, other sections (upstream HTTP, model, serialization) through
+# timed(). The totals go out as a Server-Timing header, requests slower than
+# SLOW_REQUEST_MS are logged with their query list, and while 1 in
+# PROFILE_SAMPLE_EVERY requests runs the process is profiled into PROFILE_DIR.
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))  # 0 disables the slow request log
+PROFILE_SAMPLE_EVERY = int(os.getenv("PROFILE_SAMPLE_EVERY", "0"))  # 0 disables profiling
+# "stack": sample the stacks of all busy threads (covers the DB executor and
+# threadpool); "cprofile": deterministic profile of the event loop thread
+PROFILE_MODE = os.getenv("PROFILE_MODE", "stack")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/request-profiles")
+STACK_SAMPLE_INTERVAL = 0.005  # seconds
+MAX_RECORDED_QUERIES = 200
+MAX_LOGGED_QUERIES = 50
+
+
+class RequestTimings:
+    """Time spent per section during one request. Written from the event loop and threadpool threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.sections: Dict[str, float] = {}
+        self.query_count = 0
+        self.queries: List[Tuple[str, float]] = []
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.sections[name] = self.sections.get(name, 0.0) + seconds
+
+    def add_query(self, statement: str, seconds: float):
+        with self._lock:
+            self.sections["db"] = self.sections.get("db", 0.0) + seconds
+            self.query_count += 1
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append((statement, seconds))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        with self._lock:
+            sections = dict(self.sections)
+            count = self.query_count
+        parts = [f'db;dur={sections.pop("db", 0.0) * 1000:.1f};desc="{count} queries"']
+        parts += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sections.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def timed(name: str):
+    """Add the block's duration to the current request's section ``name``; a no-op outside requests."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def install_db_listeners(db_engine: Engine):
+    """Attribute every statement executed through ``db_engine`` to the current request."""
+
+    @event.listens_for(db_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("request_timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(db_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        timings = _current.get()
+        started = conn.info.get("request_timing_started")
+        if timings is not None and started:
+            timings.add_query(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(db_engine, "handle_error")
+    def failed(exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        started = conn.info.get("request_timing_started") if conn is not None else None
+        if started:
+            started.pop()
+
+
+# --- sampled profiling ------------------------------------------------------
+# A profile is not scoped to its request: the stack sampler sees every busy
+# thread of the process and cProfile every coroutine the event loop runs while
+# it is enabled, including requests running concurrently. The files are named
+# and logged as process profiles taken during the request for that reason.
+
+# Leaf frames of threads that are waiting rather than working
+_IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+                ("threading.py", "_wait_for_tstate_lock"), ("socket.py", "accept"),
+                ("thread.py", "_worker")}
+
+
+class StackSampler:
+    """Samples the Python stacks of all busy threads of the process into folded-stack counts (flamegraph input)."""
+
+    def __init__(self, interval: float = STACK_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _Profile:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.profiler = cProfile.Profile() if mode == "cprofile" else StackSampler()
+
+    def start(self):
+        if self.mode == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop_and_write(self, path: str) -> str:
+        if self.mode == "cprofile":
+            self.profiler.disable()
+            path += ".prof"  # python -m pstats / snakeviz
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.stop()
+            path += ".folded"  # flamegraph.pl / speedscope
+            self.profiler.write(path)
+        return path
+
+
+# --- middleware -----------------------------------------------------------------
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware: Server-Timing header, slow request log and sampled
+    process profiles taken while a request runs.
+
+    The header is added when the response starts, so for streaming responses it
+    covers the time to the first byte; the slow request log uses the full
+    duration including the body.
+    """
+
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS,
+                 profile_every: int = PROFILE_SAMPLE_EVERY, profile_mode: str = PROFILE_MODE,
+                 profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+        self.profile_every = profile_every
+        self.profile_mode = profile_mode
+        self.profile_dir = profile_dir
+        self._counter = itertools.count(1)
+        self._profiling = False  # One profile at a time: cProfile cannot be enabled twice on a thread
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profile = None
+        if self.profile_every and next(self._counter) % self.profile_every == 0 and not self._profiling:
+            self._profiling = True
+            profile = _Profile(self.profile_mode)
+            profile.start()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            elapsed_ms = timings.elapsed() * 1000
+            request_line = f"{scope['method']} {scope['path']}"
+            if profile is not None:
+                self._write_profile(profile, request_line, elapsed_ms)
+                self._profiling = False
+            if self.slow_request_ms and elapsed_ms >= self.slow_request_ms:
+                self._log_slow(timings, request_line, status["code"], elapsed_ms)
+
+    def _write_profile(self, profile: _Profile, request_line: str, elapsed_ms: float):
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            name = re.sub(r"[^A-Za-z0-9]+", "_", request_line).strip("_")
+            stem = f"{time.strftime('%Y%m%d-%H%M%S')}-process-during-{name}-{elapsed_ms:.0f}ms"
+            path = profile.stop_and_write(os.path.join(self.profile_dir, stem))
+            logger.info(f"Process profile during {request_line} ({elapsed_ms:.1f} ms): {path}")
+        except OSError as e:
+            logger.warning(f"Could not write process profile: {e}")
+
+    def _log_slow(self, timings: RequestTimings, request_line: str, status: int, elapsed_ms: float):
+        lines = [f"Slow request {request_line} -> {status}: {elapsed_ms:.1f} ms ({timings.server_timing()})"]
+        for i, (statement, seconds) in enumerate(timings.queries[:MAX_LOGGED_QUERIES]):
+            lines.append(f"  {i + 1}. {seconds * 1000:.1f} ms  {' '.join(statement.split())[:300]}")
+        if timings.query_count > MAX_LOGGED_QUERIES:
+            lines.append(f"  ... {timings.query_count - MAX_LOGGED_QUERIES} more")
+        logger.warning("\n".join(lines))
@@ -0,0 +1,128 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from catalog import CatalogSnapshot
+
+DAY = 24 * 3600
+
+
+@dataclass
+class ScoringWeights:
+    affinity: float = 1.0
+    trending: float = 0.5
+    recency: float = 0.2
+    noise: float = 0.05  # Random jitter replaces the old shuffles so equal scores rotate
+    recency_days: float = 30.0  # Events this far ahead get ~37% of the recency bonus
+
+
+def _normalise(values: np.ndarray, axis: int = -1) -> np.ndarray:
+    top = values.max(axis=axis, keepdims=True) if values.size else values
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(top > 0, values / np.where(top > 0, top, 1), 0.0)
+
+
+def static_scores(snapshot: CatalogSnapshot, weights: ScoringWeights,
+                  now: Optional[float] = None) -> np.ndarray:
+    """User independent part of the score: trending plus recency of upcoming events."""
+    now = time.time() if now is None else now
+    trending = _normalise(snapshot.popularity)
+    ahead = (snapshot.dates - now) / (weights.recency_days * DAY)
+    with np.errstate(invalid="ignore", over="ignore"):
+        recency = np.where(ahead >= 0, np.exp(-ahead), 0.0)
+    recency = np.nan_to_num(recency, nan=0.0)
+    return weights.trending * trending + weights.recency * recency
+
+
+def score(snapshot: CatalogSnapshot, affinity: np.ndarray, seen: np.ndarray,
+          weights: ScoringWeights = ScoringWeights(), rng: Optional[np.random.Generator] = None,
+          now: Optional[float] = None) -> np.ndarray:
+    """
+    Score every event of the snapshot for one user.
+
+    ``affinity`` holds one weight per category code and ``seen`` is a boolean
+    mask over events; seen events score ``-inf`` and are never selected.
+    """
+    rng = rng or np.random.default_rng()
+    scores = static_scores(snapshot, weights, now)
+    if affinity.size:
+        scores += weights.affinity * _normalise(affinity)[snapshot.category_codes]
+    if weights.noise:
+        scores += weights.noise * rng.random(len(snapshot))
+    scores[seen] = -np.inf
+    return scores
+
+
+def score_batch(snapshot: CatalogSnapshot, affinity: np.ndarray, seen: np.ndarray,
+                weights: ScoringWeights = ScoringWeights(), rng: Optional[np.random.Generator] = None,
+                now: Optional[float] = None) -> np.ndarray:
+    """
+    Score many users at once.
+
+    ``affinity`` is a users x categories matrix, ``seen`` a users x events mask;
+    the result is a users x events score matrix.
+    """
+    rng = rng or np.random.default_rng()
+    scores = np.broadcast_to(static_scores(snapshot, weights, now), seen.shape).copy()
+    if affinity.size:
+        scores += weights.affinity * _normalise(affinity, axis=1)[:, snapshot.category_codes]
+    if weights.noise:
+        scores += weights.noise * rng.random(seen.shape)
+    scores[seen] = -np.inf
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int, category_codes: Optional[np.ndarray] = None,
+          max_per_category: Optional[int] = None) -> np.ndarray:
+    """
+    Row indices of the ``k`` best finite scores, best first.
+
+    With ``max_per_category`` no category contributes more than that many events
+    while other categories still have candidates; leftover slots are then filled
+    by score regardless of category.
+    """
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if k <= 0 or candidates.size == 0:
+        return candidates[:0]
+
+    if max_per_category is None or category_codes is None:
+        pool = candidates
+        if pool.size > k:
+            pool = pool[np.argpartition(-scores[pool], k - 1)[:k]]
+        return pool[np.argsort(-scores[pool], kind="stable")]
+
+    # Diversification only needs a bounded pool: enough to fill k slots after capping
+    pool_size = min(candidates.size, k * max(max_per_category, 1) * 4)
+    pool = candidates
+    if pool.size > pool_size:
+        pool = pool[np.argpartition(-scores[pool], pool_size - 1)[:pool_size]]
+    pool = pool[np.argsort(-scores[pool], kind="stable")]
+
+    picked, skipped, per_category = [], [], {}
+    for row in pool:
+        code = int(category_codes[row])
+        if per_category.get(code, 0) < max_per_category:
+            per_category[code] = per_category.get(code, 0) + 1
+            picked.append(row)
+            if len(picked) == k:
+                break
+        else:
+            skipped.append(row)
+    picked.extend(skipped[:k - len(picked)])
+    return np.asarray(picked, dtype=np.int64)
+
+
+def top_k_batch(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per-row top-k indices (best first) of a users x events score matrix; -1 pads rows with fewer candidates."""
+    n_users, n_events = scores.shape
+    k = min(k, n_events)
+    if k == 0:
+        return np.empty((n_users, 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    result = np.take_along_axis(part, order, axis=1)
+    result[~np.isfinite(np.take_along_axis(part_scores, order, axis=1))] = -1
+    return result
@@ -0,0 +1,157 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def to_epoch(ts: datetime) -> float:
+    # Interaction timestamps are stored as naive UTC (datetime.utcnow)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class _UserHistory:
+    """Recent interactions of one user, oldest first, as compact parallel int/float arrays."""
+
+    __slots__ = ("event_ids", "timestamps", "loaded_at")
+
+    def __init__(self):
+        self.event_ids = array("q")
+        self.timestamps = array("d")
+        self.loaded_at = time.time()
+
+    def append(self, event_id: int, ts: float, max_events: int):
+        self.event_ids.append(event_id)
+        self.timestamps.append(ts)
+        overflow = len(self.event_ids) - max_events
+        if overflow > 0:
+            del self.event_ids[:overflow]
+            del self.timestamps[:overflow]
+
+    def prune(self, cutoff: float):
+        # Timestamps are appended in order, so expired entries form a prefix
+        expired = 0
+        for ts in self.timestamps:
+            if ts > cutoff:
+                break
+            expired += 1
+        if expired:
+            del self.event_ids[:expired]
+            del self.timestamps[:expired]
+
+
+class SeenCache:
+    """
+    Bounded per-user cache of recent event interactions fed by the click stream.
+
+    A user's history is hydrated from the database (via the ``loader`` passed to
+    ``get``) and then kept current by ``record``. Clicks for users that are not
+    cached are ignored: the next ``get`` loads them from the database anyway.
+    Clicks recorded while a user's history is being loaded are merged into the
+    loaded history, so they are not lost if the query missed them.
+
+    With several workers a click reaches only the worker that handled it, so a
+    history is re-hydrated once it is older than ``ttl_seconds``; other workers'
+    clicks show up within that time.
+    """
+
+    def __init__(self, window_seconds: float = 7 * 24 * 3600, max_users: int = 10000,
+                 max_events_per_user: int = 256, ttl_seconds: float = 60.0):
+        self.window_seconds = window_seconds
+        self.max_users = max_users
+        self.max_events_per_user = max_events_per_user
+        self.ttl_seconds = ttl_seconds
+        self._users: "OrderedDict[int, _UserHistory]" = OrderedDict()
+        # Clicks recorded while a load for the user is running, and the number of running loads
+        self._pending: Dict[int, List[Tuple[int, float]]] = {}
+        self._loads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, user_id: int,
+            loader: Callable[[datetime], Iterable[Tuple[int, datetime]]]) -> List[int]:
+        """Return event ids the user interacted with inside the window, oldest first."""
+        cutoff = time.time() - self.window_seconds
+
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is not None and time.time() - history.loaded_at < self.ttl_seconds:
+                self._users.move_to_end(user_id)
+                history.prune(cutoff)
+                self.hits += 1
+                return history.event_ids.tolist()
+            if history is not None:
+                self.expired += 1
+            else:
+                self.misses += 1
+            self._loads[user_id] = self._loads.get(user_id, 0) + 1
+            self._pending.setdefault(user_id, [])
+
+        # Load outside the lock so a slow query does not block other users
+        since = datetime.utcfromtimestamp(cutoff)
+        try:
+            loaded = [(event_id, to_epoch(ts)) for event_id, ts in loader(since)]
+        except BaseException:
+            with self._lock:
+                self._finish_load(user_id)
+            raise
+
+        with self._lock:
+            pending = self._finish_load(user_id)
+            # A concurrent request may have hydrated the user after this load started; keep that copy
+            existing = self._users.get(user_id)
+            if existing is not None and existing is not history:
+                self._users.move_to_end(user_id)
+                return existing.event_ids.tolist()
+            # Clicks recorded during the load that its query did not see
+            seen = set(loaded)
+            loaded.extend(click for click in pending if click not in seen and click[1] > cutoff)
+            loaded.sort(key=lambda click: click[1])
+            history = _UserHistory()
+            for event_id, ts in loaded:
+                history.append(event_id, ts, self.max_events_per_user)
+            self._users[user_id] = history
+            self._users.move_to_end(user_id)
+            self._evict()
+            return history.event_ids.tolist()
+
+    def _finish_load(self, user_id: int) -> List[Tuple[int, float]]:
+        self._loads[user_id] -= 1
+        if self._loads[user_id]:
+            return list(self._pending[user_id])
+        del self._loads[user_id]
+        return self._pending.pop(user_id)
+
+    def record(self, user_id: Optional[int], event_id: int, timestamp: Optional[datetime] = None):
+        """Append an interaction for an already hydrated user (or one being loaded)."""
+        if user_id is None:
+            return
+        ts = to_epoch(timestamp) if timestamp is not None else time.time()
+        with self._lock:
+            if user_id in self._pending:
+                self._pending[user_id].append((event_id, ts))
+            history = self._users.get(user_id)
+            if history is not None:
+                history.append(event_id, ts, self.max_events_per_user)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+            }
+
+    def _evict(self):
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
@@ -0,0 +1,207 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from db_models import EventClick, EventView
+from seen_cache import to_epoch
+
+logger = logging.getLogger(__name__)
+
+# Column dtypes of the exported tables. Anonymous interactions (NULL user_id)
+# are stored as user_id -1; timestamps as UTC epoch seconds.
+TABLES = {
+    "clicks": (EventClick, {"id": np.int64, "user_id": np.int64, "event_id": np.int64, "timestamp": np.float64}),
+    "views": (EventView, {"id": np.int64, "user_id": np.int64, "event_id": np.int64,
+                          "view_duration": np.float32, "timestamp": np.float64}),
+}
+
+MANIFEST = "manifest.json"
+EXPORT_LOCK = ".export.lock"
+
+
+def _convert(column: str, values: list) -> list:
+    if column == "timestamp":
+        return [to_epoch(v) if v is not None else np.nan for v in values]
+    if column == "user_id":
+        return [-1 if v is None else v for v in values]
+    if column == "view_duration":
+        return [0.0 if v is None else v for v in values]
+    return values
+
+
+class InteractionSnapshots:
+    """
+    Incremental columnar copy of the interaction tables on local disk.
+
+    Every export appends the rows added since the table's watermark (the last
+    exported id) as a new partition directory holding one ``.npy`` file per
+    column, then advances the watermark in ``manifest.json``. Partitions and
+    the manifest are written under temporary names and renamed into place, so
+    readers only ever see complete partitions. Readers memory-map the column
+    files and never touch Postgres.
+
+    Rows newer than ``lag_seconds`` are left for the next export: ids are
+    assigned at insert time but become visible at commit, so a transaction
+    committing late could otherwise land below an already advanced watermark.
+    """
+
+    def __init__(self, root: str, partition_rows: int = 1_000_000, lag_seconds: float = 60.0,
+                 batch_size: int = 10_000):
+        self.root = root
+        self.partition_rows = partition_rows
+        self.lag_seconds = lag_seconds
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    # --- manifest -------------------------------------------------------
+
+    def manifest(self) -> Dict:
+        path = os.path.join(self.root, MANIFEST)
+        if not os.path.exists(path):
+            return {"tables": {}}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict):
+        path = os.path.join(self.root, MANIFEST)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def watermark(self, table: str) -> int:
+        return self.manifest()["tables"].get(table, {}).get("watermark_id", 0)
+
+    # --- export ---------------------------------------------------------
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        # Every worker runs an exporter over the same directory: flock keeps a
+        # second process from writing the same partition and manifest, the
+        # thread lock covers threads of one process
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            fd = os.open(os.path.join(self.root, EXPORT_LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    def export(self, db: Session, table: str) -> int:
+        """Append rows added since the watermark; returns the number of rows exported."""
+        model, dtypes = TABLES[table]
+        columns = list(dtypes)
+        with self._exclusive():
+            # Read under the lock: another process may have advanced the watermark
+            manifest = self.manifest()
+            entry = manifest["tables"].setdefault(table, {"watermark_id": 0, "rows": 0, "partitions": []})
+            cutoff = time.time() - self.lag_seconds
+
+            statement = (
+                select(*[getattr(model, c) for c in columns])
+                .where(model.id > entry["watermark_id"])
+                .order_by(model.id)
+                .execution_options(yield_per=self.batch_size)
+            )
+            exported = 0
+            pending: List[Sequence] = []
+            for rows in db.execute(statement).partitions():
+                # Stop at the first row inside the lag window (rows are in id order)
+                fresh = next((i for i, row in enumerate(rows)
+                              if row.timestamp is not None and to_epoch(row.timestamp) > cutoff), None)
+                pending.extend(rows if fresh is None else rows[:fresh])
+                while len(pending) >= self.partition_rows:
+                    exported += self._write_partition(table, entry, columns, dtypes,
+                                                      pending[:self.partition_rows], manifest)
+                    pending = pending[self.partition_rows:]
+                if fresh is not None:
+                    break
+            if pending:
+                exported += self._write_partition(table, entry, columns, dtypes, pending, manifest)
+            if exported:
+                logger.info(f"Exported {exported} {table} up to id {entry['watermark_id']}")
+            return exported
+
+    def _write_partition(self, table: str, entry: Dict, columns: List[str], dtypes: Dict,
+                         rows: Sequence, manifest: Dict) -> int:
+        name = f"part-{len(entry['partitions']) + 1:06d}"
+        table_dir = os.path.join(self.root, table)
+        final_dir = os.path.join(table_dir, name)
+        tmp_dir = f"{final_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        arrays = {}
+        for i, column in enumerate(columns):
+            arrays[column] = np.asarray(_convert(column, [row[i] for row in rows]), dtype=dtypes[column])
+            np.save(os.path.join(tmp_dir, f"{column}.npy"), arrays[column])
+        # A directory under this name that is not in the manifest is left over from an interrupted export
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+
+        timestamps = arrays["timestamp"]
+        entry["partitions"].append({
+            "name": name,
+            "rows": len(rows),
+            "min_id": int(arrays["id"][0]),
+            "max_id": int(arrays["id"][-1]),
+            "min_timestamp": float(np.nanmin(timestamps)) if len(rows) else None,
+            "max_timestamp": float(np.nanmax(timestamps)) if len(rows) else None,
+        })
+        entry["watermark_id"] = int(arrays["id"][-1])
+        entry["rows"] += len(rows)
+        entry["exported_at"] = time.time()
+        self._write_manifest(manifest)
+        return len(rows)
+
+    def export_all(self, db: Session) -> Dict[str, int]:
+        return {table: self.export(db, table) for table in TABLES}
+
+    # --- read -----------------------------------------------------------
+
+    def has_data(self, table: str) -> bool:
+        return bool(self.manifest()["tables"].get(table, {}).get("rows"))
+
+    def load(self, table: str, columns: Iterable[str], since: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Columns of all partitions, memory-mapped. With ``since`` (epoch seconds)
+        partitions older than it are skipped and rows filtered by timestamp; only
+        the selected rows are copied into memory.
+        """
+        columns = list(columns)
+        _, dtypes = TABLES[table]
+        parts = {c: [] for c in columns}
+        for partition in self.manifest()["tables"].get(table, {}).get("partitions", []):
+            if since is not None and (partition["max_timestamp"] or 0) <= since:
+                continue
+            part_dir = os.path.join(self.root, table, partition["name"])
+            mapped = {c: np.load(os.path.join(part_dir, f"{c}.npy"), mmap_mode="r") for c in columns}
+            if since is not None:
+                keep = np.load(os.path.join(part_dir, "timestamp.npy"), mmap_mode="r") > since
+                mapped = {c: values[keep] for c, values in mapped.items()}
+            for c in columns:
+                parts[c].append(mapped[c])
+        # A single partition is returned as the memory map itself, without a copy
+        return {c: (parts[c][0] if len(parts[c]) == 1 else np.concatenate(parts[c])) if parts[c]
+                else np.empty(0, dtype=dtypes[c]) for c in columns}
+
+    def stats(self) -> Dict:
+        return {
+            table: {k: entry.get(k) for k in ("watermark_id", "rows", "exported_at")}
+            | {"partitions": len(entry.get("partitions", []))}
+            for table, entry in self.manifest()["tables"].items()
+        }
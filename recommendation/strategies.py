@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from catalog import CatalogSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RankRequest:
+    """Everything a strategy needs to rank the catalog for one request."""
+    snapshot: CatalogSnapshot
+    user_id: Optional[int]
+    limit: int
+    excluded: np.ndarray  # Events outside the request's filters (boolean mask over snapshot rows)
+    recent_clicks: List[int]  # Recently seen event ids
+    affinity: Dict[str, float] = field(default_factory=dict)  # Category affinity, loaded before ranking
+    shadow: bool = False  # Shadow run: measured only, so it must not record anything served requests see
+    queries: int = 0  # DB queries issued to load this request's inputs (see StrategyRegistry.count_queries)
+
+
+# A strategy returns snapshot row indices, best first. Everything it needs from
+# the database is loaded into the request beforehand, so ranking never blocks
+# on a query (it runs on the event loop).
+RankFn = Callable[[RankRequest], np.ndarray]
+
+
+class StrategyStats:
+    """Latency, DB queries and hit/empty counts of one strategy, served and shadow runs separately."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = {"served": 0, "shadow": 0}
+        self.empty = {"served": 0, "shadow": 0}
+        self.errors = {"served": 0, "shadow": 0}
+        self.latency_total = {"served": 0.0, "shadow": 0.0}
+        self.latency_max = {"served": 0.0, "shadow": 0.0}
+        self.queries = {"served": 0, "shadow": 0}
+        self.overlap_total = 0.0  # Shadow only: share of the served list this strategy also returned
+
+    def observe(self, mode: str, seconds: float, queries: int, returned: int):
+        with self._lock:
+            self.runs[mode] += 1
+            self.latency_total[mode] += seconds
+            self.latency_max[mode] = max(self.latency_max[mode], seconds)
+            self.queries[mode] += queries
+            if returned == 0:
+                self.empty[mode] += 1
+
+    def error(self, mode: str):
+        with self._lock:
+            self.errors[mode] += 1
+
+    def overlap(self, value: float):
+        with self._lock:
+            self.overlap_total += value
+
+    def stats(self) -> Dict:
+        result = {}
+        for mode in ("served", "shadow"):
+            runs = self.runs[mode]
+            result[mode] = {
+                "runs": runs,
+                "errors": self.errors[mode],
+                "avg_ms": round(self.latency_total[mode] / runs * 1000, 3) if runs else 0.0,
+                "max_ms": round(self.latency_max[mode] * 1000, 3),
+                "avg_queries": round(self.queries[mode] / runs, 3) if runs else 0.0,
+                "hit_rate": round(1 - self.empty[mode] / runs, 4) if runs else None,
+                "empty_rate": round(self.empty[mode] / runs, 4) if runs else None,
+            }
+        if self.runs["shadow"]:
+            result["shadow"]["avg_overlap_with_served"] = round(self.overlap_total / self.runs["shadow"], 4)
+        return result
+
+
+class TrafficSplit:
+    """
+    Deterministic split of users between strategies, e.g. ``"default:90,mf:10"``.
+
+    A user id always maps to the same bucket, so a user keeps seeing one
+    strategy; anonymous requests go to the first strategy of the split.
+    """
+
+    def __init__(self, spec: str, default: str):
+        self.default = default
+        self.shares: List[Tuple[str, int]] = []
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            name, _, share = part.partition(":")
+            self.shares.append((name.strip(), int(share or 0)))
+        self.total = sum(share for _, share in self.shares)
+
+    def choose(self, user_id: Optional[int]) -> str:
+        if not self.total:
+            return self.default
+        if user_id is None:
+            return self.shares[0][0]
+        # Multiplicative hash spreads consecutive ids across buckets
+        bucket = (user_id * 2654435761) % 2 ** 32 % self.total
+        for name, share in self.shares:
+            if bucket < share:
+                return name
+            bucket -= share
+        return self.default
+
+
+class QueryCount:
+    def __init__(self):
+        self.count = 0
+
+
+class StrategyRegistry:
+    """
+    Named ranking strategies with per-strategy accounting.
+
+    Strategies rank without touching the database; the queries that load a
+    request's inputs (seen history, affinity) are counted on the loading
+    thread with ``count_queries`` and charged to the served strategy. Shadow
+    runs reuse those inputs and are charged nothing.
+    """
+
+    def __init__(self, engine: Engine, default: str, split: str = ""):
+        self.default = default
+        self.split = TrafficSplit(split, default)
+        self._strategies: Dict[str, RankFn] = {}
+        self._stats: Dict[str, StrategyStats] = {}
+        self._local = threading.local()
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def count_query(conn, cursor, statement, parameters, context, executemany):
+            counter = getattr(self._local, "counter", None)
+            if counter is not None:
+                counter.count += 1
+
+    @contextmanager
+    def count_queries(self) -> Iterator[QueryCount]:
+        """Counts the queries the calling thread issues inside the block."""
+        counter = QueryCount()
+        self._local.counter = counter
+        try:
+            yield counter
+        finally:
+            self._local.counter = None
+
+    def register(self, name: str, rank: RankFn):
+        self._strategies[name] = rank
+        self._stats[name] = StrategyStats()
+
+    def names(self) -> List[str]:
+        return list(self._strategies)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._strategies
+
+    def choose(self, user_id: Optional[int]) -> str:
+        name = self.split.choose(user_id)
+        return name if name in self._strategies else self.default
+
+    def run(self, name: str, request: RankRequest, mode: str = "served") -> np.ndarray:
+        stats = self._stats[name]
+        started = time.perf_counter()
+        try:
+            rows = self._strategies[name](request)
+        except Exception:
+            stats.error(mode)
+            raise
+        queries = 0 if mode == "shadow" else request.queries
+        stats.observe(mode, time.perf_counter() - started, queries, len(rows))
+        return rows
+
+    def record_overlap(self, name: str, rows: np.ndarray, served: np.ndarray):
+        if served.size:
+            self._stats[name].overlap(len(np.intersect1d(rows, served)) / served.size)
+
+    def stats(self) -> Dict:
+        return {name: stats.stats() for name, stats in self._stats.items()}
+
+
+class ShadowRunner:
+    """
+    Bounded pool for shadow strategy runs. Jobs are submitted after the
+    response has been sent; when all workers are busy and the queue is full
+    the job is dropped (and counted) instead of piling up.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 32):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shadow")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, job: Callable[[], None]) -> bool:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        future = self._executor.submit(job)
+        future.add_done_callback(self._done)
+        return True
+
+    def _done(self, future):
+        self._slots.release()
+        if future.exception() is not None:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Shadow strategy run failed: {future.exception()}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"submitted": self.submitted, "dropped": self.dropped, "failed": self.failed}